@@ -0,0 +1,138 @@
+"""Local stand-in for the Noiseblend API, answering with canned payloads.
+
+Point the skill at it with NOISEBLEND_API_URL=http://127.0.0.1:<port>. It
+also accepts Alexa directive service calls (progressive responses) when it
+is used as the envelope's `apiEndpoint`.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import requests
+from ask_sdk_core.api_client import DefaultApiClient
+from ask_sdk_model.services import ApiClientResponse
+
+DEVICES = [
+    {
+        "id": "kitchen",
+        "name": "Kitchen",
+        "type": "Speaker",
+        "is_active": True,
+        "is_restricted": False,
+    },
+    {
+        "id": "living-room",
+        "name": "Living Room",
+        "type": "Speaker",
+        "is_active": False,
+        "is_restricted": False,
+    },
+]
+PLAYBACK = {
+    "is_playing": True,
+    "item": {
+        "id": "track",
+        "name": "Hello",
+        "artists": [{"id": "adele", "name": "Adele"}],
+    },
+}
+ATTRIBUTES = {"energy": 0.5, "tempo": 120.0, "valence": 0.6}
+PLAYLIST = "bench-playlist"
+
+DIRECTIVES = "v1/directives"
+
+RESPONSES = {
+    ("GET", "devices"): DEVICES,
+    ("GET", "playback"): PLAYBACK,
+    ("POST", "blend"): ATTRIBUTES,
+    ("POST", "radio"): {"seeds": [{"id": "adele", "type": "artist"}]},
+}
+
+
+class NoiseblendAPIHandler(BaseHTTPRequestHandler):
+    def respond(self, method):
+        path = self.path.split("?", 1)[0].strip("/")
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or "{}") if length else {}
+        self.server.requests.append((method, path, body))
+
+        if path == DIRECTIVES:
+            self.send_response(204)
+            self.end_headers()
+            return
+
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        payload = RESPONSES.get((method, path), {})
+        if path == "blend" and body.get("return_playlist"):
+            payload = {"attributes": payload, "playlist": {"id": PLAYLIST}}
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.end_headers()
+
+    def do_GET(self):
+        self.respond("GET")
+
+    def do_POST(self):
+        self.respond("POST")
+
+    def log_message(self, *args):
+        pass
+
+
+class NoiseblendAPIServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, delay=0):
+        super().__init__((host, port), NoiseblendAPIHandler)
+        self.requests = []
+        self.delay = delay
+
+    @property
+    def directives(self):
+        return [body for _, path, body in self.requests if path == DIRECTIVES]
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class LocalApiClient(DefaultApiClient):
+    """Alexa API client that also talks plain HTTP, to reach the stand-in."""
+
+    def invoke(self, request):
+        if not request.url.startswith("http://"):
+            return super().invoke(request)
+
+        resp = requests.request(
+            request.method,
+            request.url,
+            headers=dict(request.headers or []),
+            data=json.dumps(request.body) if request.body is not None else None,
+        )
+        return ApiClientResponse(
+            headers=list(resp.headers.items()),
+            status_code=resp.status_code,
+            body=resp.text,
+        )
+
+
+if __name__ == "__main__":
+    server = NoiseblendAPIServer(port=8765)
+    print(f"Serving the Noiseblend API stand-in on {server.url}")
+    server.serve_forever()
@@ -0,0 +1,258 @@
+"""Generate synthetic Alexa request envelopes from the interaction models.
+
+Intents, sample utterances and slot values come from the models, so the
+traffic stays in sync with them. The output is a JSON list that
+bench/replay.py accepts:
+
+    python bench/generate.py -n 500 --seed 7 --rate 20 -o /tmp/traffic.json
+    python bench/replay.py /tmp/traffic.json --pace
+"""
+
+import argparse
+import json
+import random
+import re
+import string
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+MODELS = [ROOT / "models" / "en-US.json", ROOT / "models" / "en-GB.json"]
+
+# Values for built-in slot types, which the models don't list
+BUILTIN_VALUES = {
+    "AMAZON.Artist": ["Adele", "Radiohead", "Daft Punk", "Miles Davis", "Lorde"],
+    "AMAZON.MusicRecording": ["Hello", "Karma Police", "Get Lucky", "So What"],
+    "AMAZON.Genre": ["jazz", "rock", "deep house", "classical", "hip hop"],
+}
+NUMBER_RANGES = {"volume": (0, 100), "volume_percent": (0, 100), "duration": (1, 60)}
+SLOT_PATTERN = re.compile(r"{(\w+)}")
+
+
+class Model:
+    def __init__(self, path):
+        model = json.loads(Path(path).read_text())
+        language_model = model["interactionModel"]["languageModel"]
+        self.locale = Path(path).stem
+        self.intents = {
+            intent["name"]: intent
+            for intent in language_model["intents"]
+            if intent.get("samples")
+        }
+        self.types = {
+            slot_type["name"]: slot_type["values"]
+            for slot_type in language_model.get("types", [])
+        }
+
+
+class EnvelopeGenerator:
+    def __init__(
+        self,
+        models,
+        seed=None,
+        mix=None,
+        can_fulfill=0.1,
+        no_match=0.05,
+        no_token=0.05,
+        users=50,
+        turns=3,
+    ):
+        self.random = random.Random(seed)
+        self.models = models
+        self.mix = mix or {}
+        self.can_fulfill = can_fulfill
+        self.no_match = no_match
+        self.no_token = no_token
+        self.users = [f"amzn1.ask.account.{self.hex(24).upper()}" for _ in range(users)]
+        self.turns = turns
+
+    def hex(self, length):
+        return "".join(self.random.choice("0123456789abcdef") for _ in range(length))
+
+    def request_id(self):
+        return f"amzn1.echo-api.request.{uuid.UUID(self.hex(32))}"
+
+    def pick_intent(self, model):
+        names = sorted(model.intents)
+        weights = [self.mix.get(name, 0 if self.mix else 1) for name in names]
+        if not any(weights):
+            weights = [1] * len(names)
+        return model.intents[self.random.choices(names, weights)[0]]
+
+    def garble(self, text):
+        letters = list(text.lower().replace(" ", ""))
+        self.random.shuffle(letters)
+        return "".join(letters[:8]) or self.random.choice(string.ascii_lowercase)
+
+    def slot_value(self, model, slot):
+        slot_type = slot["type"]
+        if slot_type == "AMAZON.NUMBER":
+            low, high = NUMBER_RANGES.get(slot["name"], (0, 10))
+            return str(self.random.randint(low, high)), None
+
+        if slot_type in BUILTIN_VALUES:
+            return self.random.choice(BUILTIN_VALUES[slot_type]), None
+
+        values = model.types.get(slot_type)
+        if not values:
+            return None, None
+
+        value = self.random.choice(values)
+        spoken = self.random.choice(
+            [value["name"]["value"]] + value["name"].get("synonyms", [])
+        )
+        if self.random.random() < self.no_match:
+            return self.garble(spoken), {
+                "authority": f"amzn1.er-authority.echo-sdk.bench.{slot_type}",
+                "status": {"code": "ER_SUCCESS_NO_MATCH"},
+            }
+
+        return spoken, {
+            "authority": f"amzn1.er-authority.echo-sdk.bench.{slot_type}",
+            "status": {"code": "ER_SUCCESS_MATCH"},
+            "values": [{"value": {"name": value["name"]["value"], "id": value["id"]}}],
+        }
+
+    def slots(self, model, intent):
+        sample = self.random.choice(intent["samples"])
+        spoken = set(SLOT_PATTERN.findall(sample))
+
+        slots = {}
+        for slot in intent.get("slots", []):
+            entry = {"name": slot["name"], "confirmationStatus": "NONE"}
+            if slot["name"] in spoken:
+                value, resolution = self.slot_value(model, slot)
+                if value is not None:
+                    entry["value"] = value
+                if resolution is not None:
+                    entry["resolutions"] = {"resolutionsPerAuthority": [resolution]}
+            slots[slot["name"]] = entry
+        return slots
+
+    def envelope(self, model, session, timestamp, can_fulfill=False):
+        intent = self.pick_intent(model)
+        user = {"userId": session["user"]}
+        if session["token"]:
+            user["accessToken"] = session["token"]
+
+        system = {
+            "application": {"applicationId": "amzn1.ask.skill.bench"},
+            "user": user,
+            "device": {
+                "deviceId": session["device"],
+                "supportedInterfaces": {},
+            },
+            "apiEndpoint": "https://api.amazonalexa.com",
+            "apiAccessToken": "bench",
+        }
+        return {
+            "version": "1.0",
+            "session": {
+                "new": session["new"],
+                "sessionId": session["id"],
+                "application": system["application"],
+                "attributes": {},
+                "user": user,
+            },
+            "context": {"System": system},
+            "request": {
+                "type": "CanFulfillIntentRequest" if can_fulfill else "IntentRequest",
+                "requestId": self.request_id(),
+                "timestamp": timestamp.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "locale": model.locale,
+                "intent": {
+                    "name": intent["name"],
+                    "confirmationStatus": "NONE",
+                    "slots": self.slots(model, intent),
+                },
+            },
+        }
+
+    def session(self):
+        token = None
+        if self.random.random() >= self.no_token:
+            token = f"bench-{self.hex(16)}"
+        return {
+            "id": f"amzn1.echo-api.session.{uuid.UUID(self.hex(32))}",
+            "user": self.random.choice(self.users),
+            "device": f"amzn1.ask.device.{self.hex(16).upper()}",
+            "token": token,
+            "new": True,
+        }
+
+    def generate(self, count, rate=None, start=None):
+        """Yield `count` envelopes, spaced by a Poisson process of `rate` per second."""
+        timestamp = start or datetime.now(timezone.utc)
+        session, turns = None, 0
+        for _ in range(count):
+            model = self.random.choice(self.models)
+            if self.random.random() < self.can_fulfill:
+                yield self.envelope(
+                    model, dict(self.session(), new=True), timestamp, can_fulfill=True
+                )
+            else:
+                if session is None or turns >= self.random.randint(1, self.turns):
+                    session, turns = self.session(), 0
+                yield self.envelope(model, session, timestamp)
+                session["new"] = False
+                turns += 1
+
+            if rate:
+                timestamp += timedelta(seconds=self.random.expovariate(rate))
+
+
+def parse_mix(spec):
+    mix = {}
+    for entry in spec.split(",") if spec else []:
+        name, _, weight = entry.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def dump(envelopes, output):
+    json.dump(envelopes, output, indent=1)
+    output.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("models", nargs="*", default=[str(path) for path in MODELS])
+    parser.add_argument("-n", "--count", type=int, default=100)
+    parser.add_argument("-o", "--output", help="file to write, stdout by default")
+    parser.add_argument("--seed", type=int, help="seed for reproducible traffic")
+    parser.add_argument("--rate", type=float, help="mean requests per second")
+    parser.add_argument(
+        "--mix",
+        help="intent weights, e.g. PlayBlendIntent=5,DislikeIntent=1 (others 0)",
+    )
+    parser.add_argument("--can-fulfill", type=float, default=0.1)
+    parser.add_argument("--no-match", type=float, default=0.05)
+    parser.add_argument("--no-token", type=float, default=0.05)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=3, help="max turns per session")
+    args = parser.parse_args()
+
+    generator = EnvelopeGenerator(
+        [Model(path) for path in args.models],
+        seed=args.seed,
+        mix=parse_mix(args.mix),
+        can_fulfill=args.can_fulfill,
+        no_match=args.no_match,
+        no_token=args.no_token,
+        users=args.users,
+        turns=args.turns,
+    )
+    start = datetime(2019, 1, 1, tzinfo=timezone.utc) if args.seed is not None else None
+    envelopes = list(generator.generate(args.count, rate=args.rate, start=start))
+
+    if args.output:
+        with open(args.output, "w") as output:
+            dump(envelopes, output)
+    else:
+        dump(envelopes, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
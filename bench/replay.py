@@ -0,0 +1,264 @@
+"""Replay Alexa request envelopes through the skill handler, in process.
+
+The skill talks to a local stand-in of the Noiseblend API and keeps its
+attributes in memory, so nothing leaves the machine:
+
+    python bench/replay.py bench/envelopes/session.json --repeat 20 --memory
+
+With `--memory`, allocations are traced from before the skill is imported and
+the report shows peak RSS and live allocations per package after init and
+after the replay.
+
+With `--dynamodb URL` attributes go to a local DynamoDb instead, and the
+report adds the time spent in each DynamoDb operation:
+
+    docker run -p 8000:8000 amazon/dynamodb-local
+    python bench/replay.py --dynamodb http://localhost:8000 --repeat 20
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+LAMBDA_DIR = BENCH_DIR.parent / "lambda" / "us-east-1_play_blend"
+
+
+class LambdaContext:
+    function_name = "noiseblend-replay"
+    function_version = "$LATEST"
+    invoked_function_arn = "arn:aws:lambda:us-east-1:000000000000:function:replay"
+    log_group_name = "/aws/lambda/noiseblend-replay"
+    log_stream_name = "replay"
+
+    def __init__(self, timeout=8):
+        self.deadline = time.time() + timeout
+        self.aws_request_id = str(uuid.uuid4())
+        self.memory_limit_in_mb = os.environ["AWS_LAMBDA_FUNCTION_MEMORY_SIZE"]
+
+    def get_remaining_time_in_millis(self):
+        return max(int((self.deadline - time.time()) * 1000), 0)
+
+
+def load_envelopes(paths):
+    envelopes = []
+    for path in paths:
+        data = json.loads(Path(path).read_text())
+        envelopes.extend(data if isinstance(data, list) else [data])
+    return envelopes
+
+
+def timestamp(envelope):
+    value = envelope["request"].get("timestamp")
+    if not value:
+        return 0
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ").timestamp()
+
+
+def fresh(envelope, api_endpoint=None):
+    envelope = json.loads(json.dumps(envelope))
+    if api_endpoint:
+        envelope["context"]["System"]["apiEndpoint"] = api_endpoint
+    envelope["request"]["requestId"] = f"amzn1.echo-api.request.{uuid.uuid4()}"
+    envelope["request"]["timestamp"] = datetime.now(timezone.utc).strftime(
+        "%Y-%m-%dT%H:%M:%SZ"
+    )
+    return envelope
+
+
+class DynamoDbTimer:
+    """Time every DynamoDb call made through `client`, per operation."""
+
+    def __init__(self, client):
+        self.started = {}
+        self.timings = {}
+        client.meta.events.register("before-call.dynamodb", self.before)
+        client.meta.events.register("after-call.dynamodb", self.after)
+
+    def before(self, model, context, **kwargs):
+        context["bench_started"] = time.perf_counter()
+
+    def after(self, model, context, **kwargs):
+        elapsed = (time.perf_counter() - context["bench_started"]) * 1000
+        self.timings.setdefault(model.name, []).append(elapsed)
+
+
+def create_table(resource, name):
+    client = resource.meta.client
+    if name in client.list_tables()["TableNames"]:
+        return
+    client.create_table(
+        TableName=name,
+        KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    client.get_waiter("table_exists").wait(TableName=name)
+    client.update_time_to_live(
+        TableName=name,
+        TimeToLiveSpecification={"Enabled": True, "AttributeName": "expires"},
+    )
+
+
+def print_timings(title, timings):
+    print(f"\n{title:<44} {'n':>5} {'p50 ms':>9} {'max ms':>9}")
+    for name, samples in timings.items():
+        samples.sort()
+        p50 = samples[len(samples) // 2]
+        print(f"{name:<44} {len(samples):>5} {p50:>9.2f} {samples[-1]:>9.2f}")
+
+
+def print_memory(title, profiling):
+    report = profiling.memory_report()
+    print(f"\n{title}: max RSS {report['max_rss_mb']} MB", end="")
+    if "traced_mb" in report:
+        print(f", traced {report['traced_mb']} MB", end="")
+        print(f" (peak {report['traced_peak_mb']} MB)")
+        for module in report["modules"]:
+            print(
+                f"  {module['module']:<28} {module['kb']:>10} KB {module['blocks']:>8}"
+            )
+    else:
+        print()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "envelopes",
+        nargs="*",
+        default=[str(BENCH_DIR / "envelopes" / "session.json")],
+        help="JSON files holding an envelope or a list of envelopes",
+    )
+    parser.add_argument("-n", "--repeat", type=int, default=1)
+    parser.add_argument("--memory", action="store_true", help="trace allocations")
+    parser.add_argument("--memory-size", default="256", help="Lambda memory in MB")
+    parser.add_argument("--api-url", help="Noiseblend API to use instead")
+    parser.add_argument("--dynamodb", help="local DynamoDb endpoint to persist to")
+    parser.add_argument(
+        "--delay", type=float, default=0, help="seconds the local API takes per call"
+    )
+    parser.add_argument(
+        "--pace",
+        action="store_true",
+        help="keep the gaps between the envelopes' original timestamps",
+    )
+    parser.add_argument("-v", "--verbose", action="store_true")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    envelopes = load_envelopes(args.envelopes)
+    if args.verbose:
+        logging.basicConfig(format="%(levelname)s %(message)s")
+
+    server = None
+    if args.api_url:
+        api_url = args.api_url
+    else:
+        sys.path.insert(0, str(BENCH_DIR))
+        from backend import LocalApiClient, NoiseblendAPIServer
+
+        server = NoiseblendAPIServer(delay=args.delay).start()
+        api_url = server.url
+
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("AWS_XRAY_SDK_ENABLED", "false")
+    if args.dynamodb:
+        os.environ["NOISEBLEND_PERSISTENCE"] = "dynamodb"
+        os.environ["NOISEBLEND_DYNAMODB_ENDPOINT"] = args.dynamodb
+        os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+        os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+    os.environ.setdefault("NOISEBLEND_PERSISTENCE", "memory")
+    os.environ["NOISEBLEND_API_URL"] = api_url
+    os.environ["AWS_LAMBDA_FUNCTION_MEMORY_SIZE"] = args.memory_size
+    if args.memory:
+        os.environ["NOISEBLEND_TRACEMALLOC"] = "1"
+        tracemalloc.start()
+
+    sys.path.insert(0, str(LAMBDA_DIR))
+    started = time.perf_counter()
+    import blend  # pylint: disable=import-error
+    from noiseblend import profiling  # pylint: disable=import-error
+
+    init_ms = (time.perf_counter() - started) * 1000
+    if server:
+        blend.sb.api_client = LocalApiClient()
+    dynamodb = None
+    if args.dynamodb:
+        from noiseblend.persistence import (  # pylint: disable=import-error
+            dynamodb_resource,
+        )
+
+        create_table(dynamodb_resource(), blend.sb.table_name)
+        dynamodb = DynamoDbTimer(dynamodb_resource().meta.client)
+    print(f"Init: {init_ms:.1f} ms")
+    if args.memory:
+        print_memory("After init", profiling)
+
+    timings = {}
+    growth = {}
+    session_attributes = {}
+    for _ in range(args.repeat):
+        replay_started = time.perf_counter()
+        first = timestamp(envelopes[0]) if args.pace and envelopes else 0
+        for envelope in envelopes:
+            if args.pace:
+                wait = timestamp(envelope) - first
+                time.sleep(max(wait - (time.perf_counter() - replay_started), 0))
+
+            envelope = fresh(envelope, api_endpoint=server and server.url)
+            session = envelope.get("session")
+            if session and not session["new"]:
+                # Alexa hands back what the previous response kept in the session
+                session["attributes"] = session_attributes.get(session["sessionId"], {})
+
+            start_rss = profiling.rss_mb() or 0
+            started = time.perf_counter()
+            response = blend.handler(envelope, LambdaContext())
+            elapsed = (time.perf_counter() - started) * 1000
+            if session:
+                session_attributes[session["sessionId"]] = (
+                    response.get("sessionAttributes") or {}
+                )
+
+            request = envelope["request"]
+            name = request.get("intent", {}).get("name") or request["type"]
+            if request["type"] == "CanFulfillIntentRequest":
+                name = f"CanFulfill{name}"
+            timings.setdefault(name, []).append(elapsed)
+            growth[name] = max(
+                growth.get(name, 0), (profiling.rss_mb() or 0) - start_rss
+            )
+            if args.verbose:
+                print(name, json.dumps(response.get("response", {}))[:160])
+
+    print(f"\n{'request':<44} {'n':>5} {'p50 ms':>9} {'max ms':>9} {'+rss MB':>8}")
+    for name, samples in timings.items():
+        samples.sort()
+        p50 = samples[len(samples) // 2]
+        print(
+            f"{name:<44} {len(samples):>5} {p50:>9.2f} {samples[-1]:>9.2f}"
+            f" {growth[name]:>8.1f}"
+        )
+
+    if server and server.directives:
+        print(f"\nProgressive responses: {len(server.directives)}")
+
+    if dynamodb:
+        print_timings("dynamodb", dynamodb.timings)
+
+    if args.memory:
+        print_memory(f"After {args.repeat} replays", profiling)
+
+
+if __name__ == "__main__":
+    main()
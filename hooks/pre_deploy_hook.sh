@@ -0,0 +1,6 @@
+#!/bin/bash
+# Compile the slot resolution index shipped with the lambda from the interaction models
+set -e
+
+cd "$(dirname "$0")/../lambda/us-east-1_play_blend"
+python3 -m noiseblend.slot_index ../../models/en-US.json ../../models/en-GB.json
@@ -3,16 +3,25 @@ import warnings  # isort:skip
 warnings.filterwarnings("ignore", category=DeprecationWarning)  # isort:skip
 warnings.filterwarnings("ignore", category=UserWarning)  # isort:skip
 
+import os  # isort:skip
+import tracemalloc  # isort:skip
+
+if os.getenv("NOISEBLEND_TRACEMALLOC") == "1":  # isort:skip
+    tracemalloc.start()
+
 import logging
+from pathlib import Path
 
 import addict
 from fuzzywuzzy import fuzz
 
-import sentry_sdk
 from ask_sdk_core.dispatch_components import AbstractRequestHandler
 from ask_sdk_core.utils import is_request_type
 from aws_xray_sdk.core import patch_all
-from noiseblend import NoiseblendRequestHandler, NoiseblendSkillBuilder
+from noiseblend.request_handler import (
+    NoiseblendRequestHandler,
+    NoiseblendSkillBuilder,
+)
 from noiseblend.can_fulfill import (
     CanFulfillDecreaseTuneableAttributeIntentHandler,
     CanFulfillDislikeIntentHandler,
@@ -34,9 +43,12 @@ from noiseblend.can_fulfill import (
     CanFulfillResetTuneableAttributeIntentHandler,
     CanFulfillResetTuneableAttributesIntentHandler,
     CanFulfillTuneAttributeIntentHandler,
+    CanFulfillTuneAttributesIntentHandler,
 )
 from noiseblend.constants import (
+    CHANGE_TUNING,
     DISLIKED_ARTIST,
+    DISLIKED_ARTIST_THROTTLED,
     EMPTY_TUNING,
     FADE_LIMIT,
     FADE_LIMIT_EXCEEDED,
@@ -46,9 +58,16 @@ from noiseblend.constants import (
     RESET_TUNEABLE_ANNOUNCE,
     SAVING_TRACK,
     SET_TUNEABLE_ANNOUNCE,
+    SET_TUNEABLES_ANNOUNCE,
+    THROTTLED,
+    TUNEABLE_AT,
+    TUNEABLE_AT_DEFAULT,
     TUNEABLE_DEFAULTS,
     TUNEABLE_LIST,
     TUNEABLE_NAMES,
+    TUNE_MORE,
+    TUNING_ATTRIBUTES,
+    UPDATING_DISLIKES,
 )
 from noiseblend.default_intents import (
     CancelOrStopIntentHandler,
@@ -64,14 +83,16 @@ from noiseblend.exception_handlers import (
     NoiseblendUnknownSlotExceptionHandler,
 )
 from noiseblend.helpers import cap, listify
-from sentry_sdk.integrations.aws_lambda import AwsLambdaIntegration
+from noiseblend.logs import configure_logging
+from noiseblend.playlists import PlaylistCache
+from noiseblend.reporting import init_sentry
+from noiseblend.tuning import adjust, apply_changes
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+configure_logging()
+logger = logging.getLogger(__name__)
 
 patch_all()
-sentry_dsn_file = Path(__file__).parent / "secrets" / "sentry_dsn"
-sentry_sdk.init(sentry_dsn_file.read_text(), integrations=[AwsLambdaIntegration()])
+init_sentry(Path(__file__).parent / "secrets" / "sentry_dsn")
 
 sb = NoiseblendSkillBuilder(table_name="noiseblend", auto_create_table=False)
 
@@ -92,31 +113,38 @@ class DislikeIntentHandler(NoiseblendRequestHandler):
         if resp:
             return resp
 
-        playback = addict.Dict(self.api_get("playback").json())
-        artists = playback.item.artists
-
-        speak = ""
-        artist_slot = self.slot("artist")
-        if artist_slot:
-            artist = max(
-                artists,
-                key=lambda a: fuzz.ratio(artist_slot.name.lower(), a.name.lower()),
-            )
-            self.api_post("dislike", artist=artist.id)
-            speak = DISLIKED_ARTIST.format(artist.name)
-        elif len(artists) > 1:
-            self.api_post("dislike", artists=[artist.id for artist in artists])
-            speak = DISLIKED_ARTIST.format(listify(a.name for a in artists))
-        else:
-            artist = artists[0]
-            self.api_post("dislike", artist=artist.id)
-            speak = DISLIKED_ARTIST.format(artist.name)
+        with self.progressive(UPDATING_DISLIKES):
+            playback = addict.Dict(self.api_get("playback").json())
+            artists = playback.item.artists
 
-        self.play_last_thing()
+            artist_slot = self.slot("artist")
+            if artist_slot:
+                artist = max(
+                    artists,
+                    key=lambda a: fuzz.ratio(artist_slot.name.lower(), a.name.lower()),
+                )
+                self.api_post("dislike", artist=artist.id)
+                disliked = artist.name
+            elif len(artists) > 1:
+                self.api_post("dislike", artists=[artist.id for artist in artists])
+                disliked = listify(a.name for a in artists)
+            else:
+                artist = artists[0]
+                self.api_post("dislike", artist=artist.id)
+                disliked = artist.name
+
+            PlaylistCache(self.attr).clear()
+            self.save_attr()
+            if self.regenerate():
+                speak = DISLIKED_ARTIST.format(disliked)
+            else:
+                speak = DISLIKED_ARTIST_THROTTLED.format(disliked)
         return self.speak(speak)
 
 
 class PlayBlendIntentHandler(NoiseblendRequestHandler):
+    attribute_paths = TUNING_ATTRIBUTES + ("playlists", "speakers")
+
     # pylint: disable=arguments-differ
     def handle(self, handler_input):
         resp = super().handle(handler_input)
@@ -133,14 +161,15 @@ class PlayBlendIntentHandler(NoiseblendRequestHandler):
         self.attr["last_blend"] = blend.to_dict()
         if "last_radio" in self.attr:
             del self.attr["last_radio"]
-        if "attributes" in self.attr and blend.id in self.attr["attributes"]:
-            del self.attr["attributes"][blend.id]
+        self.tuning.delete(blend.id)
         self.save_attr()
 
         return self.play_blend(blend, volume=self.volume)
 
 
 class PlayRandomIntentHandler(NoiseblendRequestHandler):
+    attribute_paths = TUNING_ATTRIBUTES + ("playlists", "speakers")
+
     # pylint: disable=arguments-differ
     def handle(self, handler_input):
         resp = super().handle(handler_input)
@@ -154,14 +183,15 @@ class PlayRandomIntentHandler(NoiseblendRequestHandler):
         self.attr["last_blend"] = {"id": "random", "name": "Random"}
         if "last_radio" in self.attr:
             del self.attr["last_radio"]
-        if "attributes" in self.attr and "random" in self.attr["attributes"]:
-            del self.attr["attributes"]["random"]
+        self.tuning.delete("random")
         self.save_attr()
 
         return self.play_random(volume=self.volume)
 
 
 class PlayRadioIntentHandler(NoiseblendRequestHandler):
+    attribute_paths = TUNING_ATTRIBUTES + ("radio_seeds", "speakers")
+
     # pylint: disable=arguments-differ
     def handle(self, handler_input, item_type):
         resp = super().handle(handler_input)
@@ -183,8 +213,7 @@ class PlayRadioIntentHandler(NoiseblendRequestHandler):
         self.attr["last_radio"] = {f"{item_type[:-1]}_names": items}
         if "last_blend" in self.attr:
             del self.attr["last_blend"]
-        if "attributes" in self.attr and "radio" in self.attr["attributes"]:
-            del self.attr["attributes"]["radio"]
+        self.tuning.delete("radio")
         self.save_attr()
 
         return self.play_radio(volume=self.volume, **self.attr["last_radio"])
@@ -345,6 +374,14 @@ class ListTuneablesIntentHandler(NoiseblendRequestHandler):
 
 
 class TuneableAttributeHandler(NoiseblendRequestHandler):
+    def reply(self, speech):
+        """Answer, offering to tune more when the user opened the session earlier."""
+        if not self.in_dialog:
+            return self.speak(speech)
+        return (
+            self.response_builder.speak(f"{speech} {TUNE_MORE}").ask(TUNE_MORE).response
+        )
+
     # pylint: disable=arguments-differ
     def handle(self, handler_input):
         resp = super().handle(handler_input)
@@ -352,20 +389,17 @@ class TuneableAttributeHandler(NoiseblendRequestHandler):
             return resp
 
         if "last_blend" in self.attr:
-            blend = addict.Dict(self.attr["last_blend"])
-            self.last_attributes = (self.attr.get("attributes") or {}).get(
-                blend.id
-            ) or {}
-            self.last_thing = blend.id
+            self.last_thing = self.attr["last_blend"]["id"]
         elif "last_radio" in self.attr:
-            self.last_attributes = (self.attr.get("attributes") or {}).get(
-                "radio", {}
-            ) or {}
             self.last_thing = "radio"
         else:
-            self.last_attributes = {}
             self.last_thing = None
 
+        if self.last_thing:
+            self.last_attributes = self.tuning.get(self.last_thing) or {}
+        else:
+            self.last_attributes = {}
+
         if not self.last_thing:
             return self.speak(NOTHING_PLAYING)
 
@@ -377,7 +411,8 @@ class TuneableAttributeHandler(NoiseblendRequestHandler):
 
     @staticmethod
     def normalize_tuneable_value(tuneable, value):
-        value = value / TUNEABLE_DEFAULTS[tuneable].max
+        defaults = TUNEABLE_DEFAULTS[tuneable]
+        value = (value - defaults.min) / (defaults.max - defaults.min)
         return cap(int(round(value * 10)), 0, 10)
 
     def tid(self, tuneable):
@@ -404,55 +439,25 @@ class TuneableAttributeHandler(NoiseblendRequestHandler):
     def announce_tuneable(self):
         tuneable_name = TUNEABLE_NAMES[self.tuneable_id]
         if self.tuneable_id not in self.last_attributes:
-            return self.speak(RESET_TUNEABLE_ANNOUNCE.format(tuneable=tuneable_name))
+            return self.reply(RESET_TUNEABLE_ANNOUNCE.format(tuneable=tuneable_name))
 
         value = self.normalize_tuneable_value(
             self.tuneable_id, self.last_tuneable_value
         )
 
-        return self.speak(
+        return self.reply(
             SET_TUNEABLE_ANNOUNCE.format(tuneable=tuneable_name, value=value)
         )
 
     def save_last_attributes(self):
-        if not "attributes" in self.attr:
-            self.attr["attributes"] = {self.last_thing: {}}
-        elif self.last_thing not in self.attr["attributes"]:
-            self.attr["attributes"][self.last_thing] = {}
-
-        for tuneable, value in self.last_attributes.items():
-            if not isinstance(value, str):
-                value = f"{value:.2f}"
-            self.attr["attributes"][self.last_thing][tuneable] = value
+        self.tuning.set(self.last_thing, self.last_attributes)
         self.save_attr()
 
     def increase(self):
-        if self.tuneable_id not in self.last_attributes:
-            self.set_tuneable_value(self.defaults.default + self.defaults.step)
-            return
-
-        if self.last_tuneable_value < self.defaults.max:
-            self.set_tuneable_value(
-                cap(
-                    self.last_tuneable_value + self.defaults.step,
-                    self.defaults.min,
-                    self.defaults.max,
-                )
-            )
+        adjust(self.last_attributes, self.tuneable_id, "increase")
 
     def decrease(self):
-        if self.tuneable_id not in self.last_attributes:
-            self.set_tuneable_value(self.defaults.default - self.defaults.step)
-            return
-
-        if self.last_tuneable_value > self.defaults.min:
-            self.set_tuneable_value(
-                cap(
-                    self.last_tuneable_value - self.defaults.step,
-                    self.defaults.min,
-                    self.defaults.max,
-                )
-            )
+        adjust(self.last_attributes, self.tuneable_id, "decrease")
 
     @property
     def tuneable(self):
@@ -466,6 +471,8 @@ class TuneableAttributeHandler(NoiseblendRequestHandler):
 
 
 class ListTuningIntentHandler(TuneableAttributeHandler):
+    attribute_paths = TUNING_ATTRIBUTES
+
     # pylint: disable=arguments-differ
     def handle(self, handler_input):
         resp = super().handle(handler_input)
@@ -502,7 +509,8 @@ class TuneAttributeIntentHandler(TuneableAttributeHandler):
         self.set_tuneable_value(value)
 
         self.save_last_attributes()
-        self.play_last_thing()
+        if not self.regenerate():
+            return self.reply(THROTTLED)
         return self.announce_tuneable()
 
 
@@ -519,7 +527,8 @@ class IncreaseTuneableAttributeIntentHandler(TuneableAttributeHandler):
             self.increase()
 
         self.save_last_attributes()
-        self.play_last_thing()
+        if not self.regenerate():
+            return self.reply(THROTTLED)
         return self.announce_tuneable()
 
 
@@ -536,7 +545,8 @@ class DecreaseTuneableAttributeIntentHandler(TuneableAttributeHandler):
             self.decrease()
 
         self.save_last_attributes()
-        self.play_last_thing()
+        if not self.regenerate():
+            return self.reply(THROTTLED)
         return self.announce_tuneable()
 
 
@@ -553,7 +563,8 @@ class MaxTuneableAttributeIntentHandler(TuneableAttributeHandler):
             self.set_tuneable_value(self.defaults.max)
 
         self.save_last_attributes()
-        self.play_last_thing()
+        if not self.regenerate():
+            return self.reply(THROTTLED)
         return self.announce_tuneable()
 
 
@@ -570,7 +581,8 @@ class MinTuneableAttributeIntentHandler(TuneableAttributeHandler):
             self.set_tuneable_value(self.defaults.min)
 
         self.save_last_attributes()
-        self.play_last_thing()
+        if not self.regenerate():
+            return self.reply(THROTTLED)
         return self.announce_tuneable()
 
 
@@ -583,11 +595,75 @@ class ResetTuneableAttributeIntentHandler(TuneableAttributeHandler):
 
         self.delete_tuneable_value()
         self.save_last_attributes()
-        self.play_last_thing()
-
+        if not self.regenerate():
+            return self.reply(THROTTLED)
         return self.announce_tuneable()
 
 
+class TuneAttributesIntentHandler(TuneableAttributeHandler):
+    """Several tuneables changed in one utterance, persisted and regenerated once."""
+
+    CHANGE_SLOTS = (
+        ("tuneableOne", "directionOne"),
+        ("tuneableTwo", "directionTwo"),
+        ("tuneableThree", "directionThree"),
+    )
+
+    @property
+    def changes(self):
+        changes = []
+        for tuneable_name, direction_name in self.CHANGE_SLOTS:
+            tuneable_slot = self.slot(tuneable_name)
+            if not tuneable_slot or not tuneable_slot.value:
+                continue
+
+            direction_slot = self.slot(direction_name)
+            if direction_slot and direction_slot.value:
+                direction = self.resolution(direction_slot).id
+            else:
+                direction = "increase"
+            changes.append((self.resolution(tuneable_slot).id, direction))
+        return changes
+
+    def announce_tuneables(self, tuneables):
+        tuning = [
+            (
+                TUNEABLE_AT.format(
+                    tuneable=TUNEABLE_NAMES[tuneable],
+                    value=self.normalize_tuneable_value(
+                        tuneable, float(self.last_attributes[tuneable])
+                    ),
+                )
+                if tuneable in self.last_attributes
+                else TUNEABLE_AT_DEFAULT.format(tuneable=TUNEABLE_NAMES[tuneable])
+            )
+            for tuneable in tuneables
+        ]
+        return self.reply(
+            SET_TUNEABLES_ANNOUNCE.format(
+                tuning=listify(tuning) if len(tuning) > 1 else tuning[0]
+            )
+        )
+
+    # pylint: disable=arguments-differ
+    def handle(self, handler_input):
+        resp = super().handle(handler_input)
+        if resp:
+            return resp
+
+        changes = self.changes
+        if not changes:
+            return (
+                self.response_builder.speak(CHANGE_TUNING).ask(CHANGE_TUNING).response
+            )
+
+        tuneables = apply_changes(self.last_attributes, changes)
+        self.save_last_attributes()
+        if not self.regenerate():
+            return self.reply(THROTTLED)
+        return self.announce_tuneables(tuneables)
+
+
 class ResetTuneableAttributesIntentHandler(TuneableAttributeHandler):
     # pylint: disable=arguments-differ
     def handle(self, handler_input):
@@ -597,9 +673,9 @@ class ResetTuneableAttributesIntentHandler(TuneableAttributeHandler):
 
         self.last_attributes = {}
         self.save_last_attributes()
-        self.play_last_thing()
-
-        return self.speak(RESET_TUNEABLE)
+        if not self.regenerate():
+            return self.reply(THROTTLED)
+        return self.reply(RESET_TUNEABLE)
 
 
 class ISPResponseHandler(NoiseblendRequestHandler):
@@ -647,6 +723,7 @@ sb.add_request_handler(PlayRandomIntentHandler())
 sb.add_request_handler(ResetTuneableAttributeIntentHandler())
 sb.add_request_handler(ResetTuneableAttributesIntentHandler())
 sb.add_request_handler(TuneAttributeIntentHandler())
+sb.add_request_handler(TuneAttributesIntentHandler())
 sb.add_request_handler(ListTuneablesIntentHandler())
 sb.add_request_handler(ListTuningIntentHandler())
 
@@ -669,6 +746,7 @@ sb.add_request_handler(CanFulfillPlayRandomIntentHandler())
 sb.add_request_handler(CanFulfillResetTuneableAttributeIntentHandler())
 sb.add_request_handler(CanFulfillResetTuneableAttributesIntentHandler())
 sb.add_request_handler(CanFulfillTuneAttributeIntentHandler())
+sb.add_request_handler(CanFulfillTuneAttributesIntentHandler())
 sb.add_request_handler(CanFulfillGenericIntentHandler())
 
 sb.add_request_handler(LaunchRequestHandler())
@@ -1 +1,2 @@
-from .request_handler import NoiseblendRequestHandler, NoiseblendSkillBuilder
+# Kept free of imports so tools like `python -m noiseblend.slot_index` can run
+# without pulling in boto3, Sentry and the rest of the skill runtime.
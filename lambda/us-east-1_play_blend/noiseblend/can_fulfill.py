@@ -12,8 +12,7 @@ from ask_sdk_model.canfulfill import (
 
 from .request_handler import NoiseblendRequestHandler
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger = logging.getLogger(__name__)
 
 ALL_INTENTS = {
     "DecreaseTuneableAttributeIntent",
@@ -35,6 +34,7 @@ ALL_INTENTS = {
     "ResetTuneableAttributeIntent",
     "ResetTuneableAttributesIntent",
     "TuneAttributeIntent",
+    "TuneAttributesIntent",
 }
 
 
@@ -239,6 +239,17 @@ class CanFulfillTuneAttributeIntentHandler(CanFulfillIntentHandler):
     CAN_FULFILL_AND_UNDERSTAND = {"tuneableValue"}
 
 
+class CanFulfillTuneAttributesIntentHandler(CanFulfillIntentHandler):
+    CAN_FULFILL_AND_UNDERSTAND_WITH_RESOLUTION = {
+        "tuneableOne",
+        "directionOne",
+        "tuneableTwo",
+        "directionTwo",
+        "tuneableThree",
+        "directionThree",
+    }
+
+
 class CanFulfillListTuneablesIntentHandler(CanFulfillIntentHandler):
     pass
 
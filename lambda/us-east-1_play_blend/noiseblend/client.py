@@ -0,0 +1,57 @@
+import time
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from .constants import API_CONNECT_TIMEOUT, API_READ_TIMEOUT
+from .endpoints import pool
+
+# Shared across invocations so warm containers reuse their connections
+session = requests.Session()
+
+RETRYABLE_STATUS = (502, 503, 504)
+
+
+def never_connected(exc):
+    """Whether `exc` was raised before a connection to the backend was made."""
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    if not isinstance(exc, requests.ConnectionError) or not exc.args:
+        return False
+    # Refused connections and failed lookups; not drops after sending
+    return isinstance(getattr(exc.args[0], "reason", None), NewConnectionError)
+
+
+def retryable(method, exc=None, resp=None):
+    """Whether a failed call can safely be sent to the next endpoint.
+
+    Reads fail over on any error. Writes only fail over when they never
+    reached the backend, so a blend is never started twice.
+    """
+    if method == "GET":
+        return exc is not None or resp.status_code in RETRYABLE_STATUS
+    return never_connected(exc)
+
+
+def request(method, path, **kwargs):
+    """Call `path` on the fastest healthy endpoint, failing over to the others."""
+    kwargs.setdefault("timeout", (API_CONNECT_TIMEOUT, API_READ_TIMEOUT))
+    candidates = pool.candidates(explore=method == "GET")
+    for attempt, endpoint in enumerate(candidates, 1):
+        last = attempt == len(candidates)
+        started = time.time()
+        try:
+            resp = session.request(method, f"{endpoint.url}/{path}", **kwargs)
+        except requests.RequestException as exc:
+            pool.fail(endpoint)
+            if last or not retryable(method, exc=exc):
+                raise
+            continue
+
+        if resp.status_code in RETRYABLE_STATUS:
+            pool.fail(endpoint)
+            if not last and retryable(method, resp=resp):
+                continue
+        else:
+            pool.record(endpoint, time.time() - started if method == "GET" else None)
+        return resp
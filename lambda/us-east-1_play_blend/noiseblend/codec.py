@@ -0,0 +1,22 @@
+import json
+import zlib
+from decimal import Decimal
+
+from .constants import ATTRIBUTES_COMPRESSION_LEVEL
+
+
+def to_json(obj):
+    if isinstance(obj, Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+
+def encode(attributes):
+    """Pack the attribute tree into one zlib compressed compact JSON blob."""
+    data = json.dumps(attributes, separators=(",", ":"), default=to_json)
+    return zlib.compress(data.encode(), ATTRIBUTES_COMPRESSION_LEVEL)
+
+
+def decode(blob):
+    data = zlib.decompress(bytes(blob))
+    return json.loads(data.decode(), parse_float=Decimal)
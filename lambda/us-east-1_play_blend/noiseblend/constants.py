@@ -1,10 +1,13 @@
 # -*- coding: utf-8 -*-
+import os
+
 import addict
 
 WELCOME = "Welcome to Noiseblend! If you want to hear some instructions, ask, how do I use this."
 PLAYING_RANDOM = "Playing something you might like."
 PLAYING_RADIO = "Playing Spotify radio."
 PLAYING_BLEND = "Playing your {} blend."
+PLAYING_BLEND_ROOMS = "Playing your {} blend on {} speakers."
 WHAT_DO_YOU_WANT = "What blend do you want to play?"
 NOTIFY_LINK_ACCOUNT = "Please link your Noiseblend account in the Amazon Alexa app."
 NOTIFY_RELINK_ACCOUNT = "There was an authentication issue. Please unlink and relink your Noiseblend account in the Amazon Alexa app."
@@ -29,6 +32,7 @@ CHOOSE_ARTIST = "Choose one of: {}"
 DISLIKED_ARTIST = (
     "I added {} to your dislikes. A new playlist will begin playing shortly."
 )
+DISLIKED_ARTIST_THROTTLED = "I added {} to your dislikes. You're changing things quickly, so the current music keeps playing for now."
 NOT_IMPLEMENTED_YET = "This feature is not implemented yet."
 SAVING_TRACK = "Saving currently playing track."
 NOTHING_PLAYING = "There's nothing playing at the moment."
@@ -41,14 +45,113 @@ RESET_TUNEABLE_ANNOUNCE = "{tuneable} has been reset to its default value. A new
 SET_TUNEABLE_ANNOUNCE = (
     "{tuneable} is at {value} now. A new playlist will begin playing shortly."
 )
+SET_TUNEABLES_ANNOUNCE = "{tuning} now. A new playlist will begin playing shortly."
+TUNEABLE_AT = "{tuneable} is at {value}"
+TUNEABLE_AT_DEFAULT = "{tuneable} is back to its default"
 UNKNOWN_SLOT = "I don't know that {slot}."
 NOISEBLEND_IMG = "https://static.noiseblend.com/img"
 EMPTY_TUNING = "You haven't tuned anything yet."
 CHANGE_TUNING = "What would you like to change?"
+TUNE_MORE = "Anything else you'd like to tune?"
+FINDING_SPEAKERS = "Finding your speakers."
+MIXING_BLEND = "Mixing your music."
+UPDATING_DISLIKES = "Okay, updating your dislikes."
+THROTTLED = "You're changing things quickly, so I'll keep the current music for now. Your tuning is saved for the next time you play."
 
 FADE_LIMIT = 60
 FADE_LIMIT_EXCEEDED = f"Fading has a limit of {FADE_LIMIT} minutes."
 
+PREFETCH_WAIT = 0.25
+PREFETCH_TTL = 20
+PREFETCH_WORKERS = 4
+PREFETCH_MAX_SESSIONS = 64
+# Bounds on what a session that ends without SessionEndedRequest can lose
+WRITE_BEHIND_CHECKPOINT = 60
+WRITE_BEHIND_MAX_TURNS = 3
+WRITE_BEHIND_MAX_BYTES = 8192
+
+TUNING_MAX_PROFILES = 16
+TUNING_MAX_BYTES = 4096
+TUNING_ATTRIBUTES = ("last_blend", "last_radio", "attributes", "attributes_lru")
+
+COMPRESS_ATTRIBUTES = os.getenv("NOISEBLEND_COMPRESS_ATTRIBUTES") == "1"
+READ_LEGACY_ATTRIBUTES = os.getenv("NOISEBLEND_READ_LEGACY_ATTRIBUTES", "1") == "1"
+ATTRIBUTES_COMPRESSION_LEVEL = 6
+
+PERSISTENCE_BACKEND = os.getenv("NOISEBLEND_PERSISTENCE", "dynamodb")
+SQLITE_PATH = os.getenv("NOISEBLEND_SQLITE_PATH", "noiseblend.db")
+
+DYNAMODB_ENDPOINT = os.getenv("NOISEBLEND_DYNAMODB_ENDPOINT")
+DYNAMODB_CONNECT_TIMEOUT = float(
+    os.getenv("NOISEBLEND_DYNAMODB_CONNECT_TIMEOUT", "0.5")
+)
+DYNAMODB_READ_TIMEOUT = float(os.getenv("NOISEBLEND_DYNAMODB_READ_TIMEOUT", "1"))
+DYNAMODB_MAX_ATTEMPTS = int(os.getenv("NOISEBLEND_DYNAMODB_MAX_ATTEMPTS", "3"))
+DYNAMODB_RETRY_MODE = os.getenv("NOISEBLEND_DYNAMODB_RETRY_MODE", "adaptive")
+DYNAMODB_POOL_SIZE = 16
+
+IDEMPOTENCY_TTL = 300
+IDEMPOTENCY_MAX_ENTRIES = 256
+PERSIST_IDEMPOTENCY = os.getenv("NOISEBLEND_PERSIST_IDEMPOTENCY") == "1"
+
+SLOT_FUZZY_THRESHOLD = 80
+
+RADIO_SEED_CACHE_SIZE = 64
+
+PLAYLIST_CACHE_TTL = int(os.getenv("NOISEBLEND_PLAYLIST_CACHE_TTL", "0"))
+PLAYLIST_CACHE_SIZE = 8
+
+EVERYWHERE = "everywhere"
+MULTI_ROOM_MAX_DEVICES = 8
+
+SPEAKER_HALF_LIFE = 14 * 24 * 3600
+SPEAKER_CONFIDENCE = 0.6
+SPEAKER_MIN_USES = 1.5
+SPEAKER_MAX_ECHOS = 8
+SPEAKER_MAX_PER_ECHO = 6
+
+API_URL = os.getenv("NOISEBLEND_API_URL", "https://api.noiseblend.com").rstrip("/")
+API_ENDPOINTS = os.getenv("NOISEBLEND_API_ENDPOINTS")
+REGION = os.getenv("AWS_REGION", "us-east-1")
+ENDPOINT_RTT_WEIGHT = 0.3
+ENDPOINT_MAX_FAILURES = 2
+ENDPOINT_COOLDOWN = 30
+# Chance a read tries an unmeasured endpoint first, to learn its latency
+ENDPOINT_EXPLORE = 0.1
+API_CONNECT_TIMEOUT = float(os.getenv("NOISEBLEND_API_CONNECT_TIMEOUT", "1"))
+API_READ_TIMEOUT = float(os.getenv("NOISEBLEND_API_READ_TIMEOUT", "6"))
+
+TOKEN_CACHE_SIZE = 128
+# Seconds past `exp` before a token is treated as expired, for clock skew
+TOKEN_EXPIRY_LEEWAY = 30
+
+# Playlist regenerations per user: bursts of up to RATE_LIMIT_BURST, refilled
+# at RATE_LIMIT_PER_MINUTE. A burst of 0 disables the limit.
+RATE_LIMIT_BURST = int(os.getenv("NOISEBLEND_RATE_LIMIT_BURST", "5"))
+RATE_LIMIT_PER_MINUTE = float(os.getenv("NOISEBLEND_RATE_LIMIT_PER_MINUTE", "6"))
+RATE_LIMIT_LOCAL_USERS = 1024
+
+MEMORY_REPORT = os.getenv("NOISEBLEND_MEMORY_REPORT") == "1"
+MEMORY_REPORT_TOP = 12
+
+PROFILE_RATE = float(os.getenv("NOISEBLEND_PROFILE_RATE", "0"))
+PROFILE_TOP = int(os.getenv("NOISEBLEND_PROFILE_TOP", "15"))
+
+WARMUP_KEY = "warmup"
+WARMUP_TIMEOUT = 2
+
+SENTRY_QUEUE_SIZE = 30
+SENTRY_FLUSH_TIMEOUT = 0.5
+SENTRY_FLUSH_MARGIN = 0.5
+
+LOG_FORMAT = os.getenv("NOISEBLEND_LOG_FORMAT", "json")
+LOG_LEVEL = os.getenv("NOISEBLEND_LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("NOISEBLEND_LOG_LEVELS", "")
+LOG_SAMPLE_RATE = float(os.getenv("NOISEBLEND_LOG_SAMPLE_RATE", "0.05"))
+
+# Seconds a backend operation may take before an interim line is spoken
+PROGRESSIVE_RESPONSE_AFTER = float(os.getenv("NOISEBLEND_PROGRESSIVE_AFTER", "1.0"))
+
 TUNEABLE_DEFAULTS = addict.Dict(
     {
         "acousticness": {"default": 0.5, "min": 0.0, "max": 1.0, "step": 0.2},
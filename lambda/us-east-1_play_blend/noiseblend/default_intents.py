@@ -9,13 +9,20 @@ from .constants import (
     WELCOME,
     WHAT_DO_YOU_WANT,
 )
+from .request_handler import NoiseblendRequestHandler
+from .tokens import token_expired
 
 
-class LaunchRequestHandler(AbstractRequestHandler):
+class LaunchRequestHandler(NoiseblendRequestHandler):
     def can_handle(self, handler_input):
         return is_request_type("LaunchRequest")(handler_input)
 
+    # pylint: disable=arguments-differ
     def handle(self, handler_input):
+        super().handle(handler_input, with_auth=False)
+        if self.token and not token_expired(self.token):
+            self.prefetch("devices")
+
         handler_input.response_builder.speak(WELCOME).ask(WHAT_DO_YOU_WANT)
         return handler_input.response_builder.response
 
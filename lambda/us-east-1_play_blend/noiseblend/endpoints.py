@@ -0,0 +1,123 @@
+"""Noiseblend API endpoints for the Lambda's region, chosen by latency.
+
+NOISEBLEND_API_ENDPOINTS maps AWS regions to endpoint lists, e.g.
+`{"eu-west-1": ["https://eu.api.noiseblend.com", "https://api.noiseblend.com"]}`,
+with an optional "default" entry. Without it the only endpoint is
+NOISEBLEND_API_URL.
+
+Latency is measured passively on reads (and by keep-warm pings) as an
+exponentially weighted moving average. Now and then a read tries an
+unmeasured endpoint first so it gets measured too. Endpoints failing in a
+row are skipped for a cooldown.
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+
+from .constants import (
+    API_ENDPOINTS,
+    API_URL,
+    ENDPOINT_COOLDOWN,
+    ENDPOINT_EXPLORE,
+    ENDPOINT_MAX_FAILURES,
+    ENDPOINT_RTT_WEIGHT,
+    REGION,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Endpoint:
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.rtt = None
+        self.failures = 0
+        self.down_until = 0
+
+    def __repr__(self):
+        return f"Endpoint({self.url}, rtt={self.rtt}, failures={self.failures})"
+
+    def healthy(self, now):
+        return self.down_until <= now
+
+
+class EndpointPool:
+    def __init__(
+        self,
+        urls,
+        weight=ENDPOINT_RTT_WEIGHT,
+        cooldown=ENDPOINT_COOLDOWN,
+        max_failures=ENDPOINT_MAX_FAILURES,
+        explore=ENDPOINT_EXPLORE,
+    ):
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.weight = weight
+        self.cooldown = cooldown
+        self.max_failures = max_failures
+        self.explore = explore
+        self.lock = threading.Lock()
+
+    def candidates(self, explore=False):
+        """Endpoints to try in order.
+
+        Healthy measured endpoints come first, fastest first, then healthy
+        unmeasured ones in configuration order. Endpoints in cooldown come
+        last, the ones recovering soonest first. With `explore`, an
+        unmeasured endpoint goes first once in a while.
+        """
+        now = time.time()
+        healthy = [e for e in self.endpoints if e.healthy(now)]
+        measured = sorted(
+            (e for e in healthy if e.rtt is not None), key=lambda e: e.rtt
+        )
+        unmeasured = [e for e in healthy if e.rtt is None]
+        down = sorted(
+            (e for e in self.endpoints if not e.healthy(now)),
+            key=lambda e: e.down_until,
+        )
+        if explore and measured and unmeasured and random.random() < self.explore:
+            return unmeasured[:1] + measured + unmeasured[1:] + down
+        return measured + unmeasured + down
+
+    def record(self, endpoint, rtt=None):
+        with self.lock:
+            endpoint.failures = 0
+            endpoint.down_until = 0
+            if rtt is None:
+                return
+            if endpoint.rtt is None:
+                endpoint.rtt = rtt
+            else:
+                endpoint.rtt += self.weight * (rtt - endpoint.rtt)
+
+    def fail(self, endpoint):
+        with self.lock:
+            endpoint.failures += 1
+            if endpoint.failures >= self.max_failures:
+                endpoint.down_until = time.time() + self.cooldown
+                logger.warning("Endpoint %s is down, failing over", endpoint.url)
+
+
+def region_endpoints(config=API_ENDPOINTS, region=REGION):
+    if not config:
+        return [API_URL]
+
+    try:
+        endpoints = json.loads(config)
+        urls = endpoints.get(region) or endpoints.get("default")
+    except (ValueError, AttributeError) as exc:
+        logger.error("Ignoring malformed NOISEBLEND_API_ENDPOINTS: %s", exc)
+        return [API_URL]
+
+    if isinstance(urls, str):
+        urls = [urls]
+    if not urls or not all(isinstance(url, str) for url in urls):
+        logger.warning("No API endpoints configured for %s", region)
+        return [API_URL]
+    return urls
+
+
+pool = EndpointPool(region_endpoints())
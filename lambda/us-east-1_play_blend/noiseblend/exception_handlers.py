@@ -5,7 +5,6 @@ from ask_sdk_model.canfulfill import CanFulfillIntentRequest
 from ask_sdk_model.services import ServiceException
 from ask_sdk_model.ui import LinkAccountCard
 from requests import HTTPError
-from sentry_sdk import capture_exception
 
 from .constants import (
     BLEND_FAILURE,
@@ -14,9 +13,9 @@ from .constants import (
     UNKNOWN_SLOT,
 )
 from .exceptions import UnknownSlotError
+from .reporting import capture
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger = logging.getLogger(__name__)
 
 
 class NoiseblendUnknownSlotExceptionHandler(AbstractExceptionHandler):
@@ -25,7 +24,7 @@ class NoiseblendUnknownSlotExceptionHandler(AbstractExceptionHandler):
 
     def handle(self, handler_input, exception):
         logger.exception(exception)
-        capture_exception(exception)
+        capture(exception)
 
         return handler_input.response_builder.speak(
             UNKNOWN_SLOT.format(slot=exception.slot)
@@ -38,7 +37,7 @@ class NoiseblendAuthExceptionHandler(AbstractExceptionHandler):
 
     def handle(self, handler_input, exception):
         logger.exception(exception)
-        capture_exception(exception)
+        capture(exception)
 
         if exception.response.status_code in (401, 403):
             handler_input.response_builder.speak(NOTIFY_RELINK_ACCOUNT).set_card(
@@ -56,7 +55,7 @@ class NoiseblendExceptionHandler(AbstractExceptionHandler):
 
     def handle(self, handler_input, exception):
         logger.exception(exception)
-        capture_exception(exception)
+        capture(exception)
 
         if isinstance(handler_input.request_envelope.request, CanFulfillIntentRequest):
             return handler_input.response_builder.response
@@ -77,7 +76,7 @@ class CatchAllExceptionHandler(AbstractExceptionHandler):
 
     def handle(self, handler_input, exception):
         logger.exception(exception)
-        capture_exception(exception)
+        capture(exception)
 
         speech = "Sorry, there was some problem. Please try again in a few minutes!"
         handler_input.response_builder.speak(speech)
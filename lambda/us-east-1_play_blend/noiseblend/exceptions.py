@@ -8,3 +8,15 @@ class UnknownSlotError(Exception):
 
     def __str__(self):
         return f"Slot {self.slot} does not have a resolution match"
+
+
+class VersionConflictError(Exception):
+
+    """Raise when persistent attributes were changed by another writer."""
+
+    def __init__(self, key, *args):
+        super().__init__(*args)
+        self.key = key
+
+    def __str__(self):
+        return f"Attributes of {self.key} were changed concurrently"
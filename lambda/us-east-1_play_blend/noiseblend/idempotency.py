@@ -0,0 +1,80 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+
+from .constants import IDEMPOTENCY_MAX_ENTRIES, IDEMPOTENCY_TTL
+from .reporting import capture
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyStore:
+    """Recently built responses keyed by Alexa request id.
+
+    Responses are kept in the container for `ttl` seconds and, when a
+    persistence adapter is given, also under `request#<id>` keys in the
+    persistence backend so duplicates delivered to another container are
+    answered without touching the Noiseblend API again. That costs a read
+    and a write per request, so it's only done for `durable` requests.
+
+    On DynamoDb the keys carry a top-level `expires` attribute; enable TTL
+    on it so the table doesn't keep them forever:
+
+        aws dynamodb update-time-to-live --table-name noiseblend \\
+            --time-to-live-specification Enabled=true,AttributeName=expires
+    """
+
+    def __init__(
+        self,
+        persistence_adapter=None,
+        ttl=IDEMPOTENCY_TTL,
+        max_entries=IDEMPOTENCY_MAX_ENTRIES,
+    ):
+        self.persistence_adapter = persistence_adapter
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    @staticmethod
+    def key(request_id):
+        return f"request#{request_id}"
+
+    def get(self, request_id, durable=True):
+        if not request_id:
+            return None
+
+        entry = self.entries.get(request_id)
+        if entry is None and durable and self.persistence_adapter is not None:
+            try:
+                key = self.key(request_id)
+                entry = self.persistence_adapter.batch_get_attributes([key]).get(key)
+            except Exception as exc:
+                logger.exception(exc)
+                capture(exc)
+
+        if not entry or entry["expires"] < time.time():
+            self.entries.pop(request_id, None)
+            return None
+        return json.loads(entry["response"])
+
+    def put(self, request_id, response, durable=True):
+        if not request_id:
+            return
+
+        entry = {
+            "response": json.dumps(response),
+            "expires": int(time.time() + self.ttl),
+        }
+        self.entries[request_id] = entry
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+        if durable and self.persistence_adapter is not None:
+            try:
+                self.persistence_adapter.batch_save_attributes(
+                    {self.key(request_id): entry}, expires=entry["expires"]
+                )
+            except Exception as exc:
+                logger.exception(exc)
+                capture(exc)
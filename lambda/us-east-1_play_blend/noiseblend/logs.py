@@ -0,0 +1,72 @@
+"""Structured logging for the skill.
+
+Records are written as one JSON object per line (NOISEBLEND_LOG_FORMAT=text
+keeps the runtime's format). The skill's loggers log at NOISEBLEND_LOG_LEVEL
+and NOISEBLEND_LOG_LEVELS overrides single loggers, e.g.
+`noiseblend.request_handler=DEBUG,botocore=WARNING`. Verbose diagnostics go
+through `sampled(logger)`, which keeps NOISEBLEND_LOG_SAMPLE_RATE of them.
+"""
+
+import json
+import logging
+import random
+
+from .constants import LOG_FORMAT, LOG_LEVEL, LOG_LEVELS, LOG_SAMPLE_RATE
+
+SKILL_LOGGERS = ("noiseblend", "blend")
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        # Set on records by the Lambda runtime's log filter
+        request_id = getattr(record, "aws_request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SampleFilter(logging.Filter):
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return self.rate >= 1 or random.random() < self.rate
+
+
+def sampled(logger, rate=LOG_SAMPLE_RATE):
+    """Child of `logger` that only lets a `rate` fraction of records through."""
+    sampled_logger = logging.getLogger(f"{logger.name}.sampled")
+    if not sampled_logger.filters:
+        sampled_logger.addFilter(SampleFilter(rate))
+    return sampled_logger
+
+
+def parse_levels(spec):
+    levels = {}
+    for entry in spec.split(","):
+        name, _, level = entry.strip().rpartition("=")
+        if level:
+            levels[name.strip() or None] = level.strip().upper()
+    return levels
+
+
+def configure_logging(fmt=LOG_FORMAT, level=LOG_LEVEL, levels=LOG_LEVELS):
+    for name in SKILL_LOGGERS:
+        logging.getLogger(name).setLevel(level)
+    for name, logger_level in parse_levels(levels).items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    root = logging.getLogger()
+    if not root.handlers:
+        root.addHandler(logging.StreamHandler())
+    if fmt == "json":
+        for handler in root.handlers:
+            handler.setFormatter(JSONFormatter())
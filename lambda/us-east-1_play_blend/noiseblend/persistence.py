@@ -0,0 +1,665 @@
+import logging
+import sqlite3
+import threading
+import time
+from copy import deepcopy
+from functools import lru_cache
+
+import boto3
+from ask_sdk_core.attributes_manager import AbstractPersistenceAdapter
+from ask_sdk_core.exceptions import PersistenceException
+from ask_sdk_dynamodb.partition_keygen import user_id_partition_keygen
+from boto3.dynamodb.types import Binary
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from .codec import decode, encode
+from .constants import (
+    DYNAMODB_CONNECT_TIMEOUT,
+    DYNAMODB_ENDPOINT,
+    DYNAMODB_MAX_ATTEMPTS,
+    DYNAMODB_POOL_SIZE,
+    DYNAMODB_READ_TIMEOUT,
+    DYNAMODB_RETRY_MODE,
+)
+from .exceptions import VersionConflictError
+
+logger = logging.getLogger(__name__)
+
+VERSION = "version"
+BLOB = "blob"
+EXPIRES = "expires"
+
+
+@lru_cache(maxsize=1)
+def dynamodb_resource(endpoint_url=DYNAMODB_ENDPOINT):
+    """DynamoDb resource shared by every invocation of the container.
+
+    Timeouts are tight for the voice path and retries back off adaptively
+    when throttled. `endpoint_url` points it at a local DynamoDb.
+    """
+    config = Config(
+        connect_timeout=DYNAMODB_CONNECT_TIMEOUT,
+        read_timeout=DYNAMODB_READ_TIMEOUT,
+        retries={"max_attempts": DYNAMODB_MAX_ATTEMPTS, "mode": DYNAMODB_RETRY_MODE},
+        max_pool_connections=DYNAMODB_POOL_SIZE,
+    )
+    return boto3.resource("dynamodb", endpoint_url=endpoint_url, config=config)
+
+
+@lru_cache(maxsize=8)
+def dynamodb_table(resource, table_name):
+    return resource.Table(table_name)
+
+
+def merge_attributes(base, local, remote):
+    """Three-way merge of attribute maps where local changes win field by field.
+
+    `base` is what this request loaded, `local` what it wants to write and
+    `remote` what another writer stored in the meantime. Fields the request
+    didn't touch keep the remote value. Without a base every local field wins.
+    """
+    base = base or {}
+    merged = deepcopy(remote)
+    for key in set(base) | set(local):
+        if key in local and key in base and local[key] == base[key]:
+            continue
+
+        if key not in local:
+            merged.pop(key, None)
+        elif isinstance(local[key], dict) and isinstance(merged.get(key), dict):
+            nested_base = base.get(key) if isinstance(base.get(key), dict) else None
+            merged[key] = merge_attributes(nested_base, local[key], merged[key])
+        else:
+            merged[key] = deepcopy(local[key])
+    return merged
+
+
+class NoiseblendPersistenceAdapter(AbstractPersistenceAdapter):
+    """Persistence adapter with optimistic concurrency on a version number.
+
+    Writes are conditional on the version read by the same request. When
+    another device wrote in between, the fresh item is read, merged with
+    :func:`merge_attributes` and the write is retried.
+
+    Backends implement `read`, `write`, `remove`, `read_many` and
+    `write_many` on partition keys. `write` must raise
+    :class:`VersionConflictError` when the stored version differs from the
+    expected one, `None` meaning the item must not have a version yet.
+    Batched writes are unconditional but bump the version like any other.
+    Backends that can expire items drop them after the batch's `expires`.
+
+    A request can :meth:`project` its load onto the top-level attributes it
+    needs. Backends supporting it implement `read_paths` and `update`; the
+    save then only writes the changed attributes, falling back to a full read
+    and merge when the request changed anything outside its projection.
+
+    Loads may be eventually consistent, the version condition catches stale
+    ones on write. Only the re-read after a conflict goes through
+    `read_latest`. The adapter is shared by every request of the container,
+    so call :meth:`forget` once a request is done with it.
+    """
+
+    MAX_MERGE_RETRIES = 3
+
+    def __init__(self, partition_keygen=user_id_partition_keygen):
+        self.partition_keygen = partition_keygen
+        self.loaded = {}
+        self.projections = {}
+
+    def read(self, key):
+        raise NotImplementedError
+
+    def read_latest(self, key):
+        """Like `read`, but never stale."""
+        return self.read(key)
+
+    def read_paths(self, key, paths):
+        """Attributes, version and whether only the top-level `paths` were read."""
+        attributes, version = self.read(key)
+        return attributes, version, False
+
+    def update(self, key, changed, removed, version):
+        """Set `changed` and delete `removed` top-level attributes, conditionally."""
+        raise NotImplementedError
+
+    def write(self, key, attributes, version):
+        raise NotImplementedError
+
+    def remove(self, key):
+        raise NotImplementedError
+
+    def read_many(self, keys):
+        return {key: self.read(key)[0] for key in keys}
+
+    def write_many(self, items, expires=None):
+        for key, attributes in items.items():
+            self.write(key, attributes, self.read(key)[1])
+
+    def loaded_version(self, request_envelope):
+        key = self.partition_keygen(request_envelope)
+        return self.loaded.get(key, (None, None, None))[0]
+
+    def loaded_paths(self, request_envelope):
+        """The projection the attributes were loaded with, `None` if they're whole."""
+        key = self.partition_keygen(request_envelope)
+        return self.loaded.get(key, (None, None, None))[2]
+
+    def expect_version(self, request_envelope, version):
+        """Condition the next write on `version`, read by an earlier request.
+
+        This wins over a load made by this request, which would only hide
+        what other requests wrote since `version`.
+        """
+        key = self.partition_keygen(request_envelope)
+        self.loaded[key] = (version, None, None)
+
+    def forget(self, request_envelope):
+        """Drop what was kept about the request's load."""
+        key = self.partition_keygen(request_envelope)
+        self.loaded.pop(key, None)
+        self.projections.pop(key, None)
+
+    def project(self, request_envelope, paths):
+        """Load only the top-level attributes in `paths` for this request, all if `None`."""
+        key = self.partition_keygen(request_envelope)
+        self.projections[key] = None if paths is None else tuple(paths)
+
+    def get_attributes(self, request_envelope):
+        key = self.partition_keygen(request_envelope)
+        paths = self.projections.pop(key, None)
+        if paths is None:
+            attributes, version = self.read(key)
+            partial = False
+        else:
+            attributes, version, partial = self.read_paths(key, paths)
+        self.loaded[key] = (version, deepcopy(attributes), paths if partial else None)
+        return attributes
+
+    def save_projected(self, key, attributes, base, paths, version):
+        """Write only what changed since a projected read, if that's all in `paths`."""
+        changed = {
+            name: value
+            for name, value in attributes.items()
+            if name not in base or base[name] != value
+        }
+        removed = [name for name in base if name not in attributes]
+        if not changed and not removed:
+            return True
+        if not set(changed) <= set(paths):
+            logger.info("Attributes of %s changed outside the projection", key)
+            return False
+
+        try:
+            self.update(key, changed, removed, version)
+            return True
+        except VersionConflictError:
+            logger.info("Attributes of %s changed concurrently", key)
+            return False
+
+    def save_attributes(self, request_envelope, attributes):
+        key = self.partition_keygen(request_envelope)
+        version, base, paths = self.loaded.pop(key, (None, None, None))
+
+        if paths is not None:
+            # A legacy item without a version can't be updated in place, and a
+            # full write of the projected subset would drop everything else
+            if version is not None and self.save_projected(
+                key, attributes, base, paths, version
+            ):
+                return
+
+            remote, version = self.read_latest(key)
+            attributes = merge_attributes(base, attributes, remote)
+            base = remote
+
+        for _ in range(self.MAX_MERGE_RETRIES + 1):
+            try:
+                self.write(key, attributes, version)
+                return
+            except VersionConflictError:
+                pass
+
+            logger.info("Attributes of %s changed concurrently, merging", key)
+            remote, version = self.read_latest(key)
+            attributes = merge_attributes(base, attributes, remote)
+            base = remote
+
+        raise PersistenceException(
+            f"Gave up saving attributes after {self.MAX_MERGE_RETRIES} conflicting writes"
+        )
+
+    def delete_attributes(self, request_envelope):
+        key = self.partition_keygen(request_envelope)
+        self.loaded.pop(key, None)
+        self.remove(key)
+
+    def batch_get_attributes(self, keys):
+        """Attributes for several partition keys, skipping missing ones."""
+        return {key: attrs for key, attrs in self.read_many(keys).items() if attrs}
+
+    def batch_save_attributes(self, items, expires=None):
+        """Unconditionally write `{partition key: attributes}`, expiring at `expires`."""
+        self.write_many(items, expires)
+
+
+class NoiseblendDynamoDbAdapter(NoiseblendPersistenceAdapter):
+    """DynamoDb backend.
+
+    With `compress` the attribute tree is written as a single compressed
+    binary attribute. `read_legacy` keeps items stored as a plain map
+    readable while a table holds both layouts.
+
+    Batched items get a top-level `expires` number, for the table's TTL.
+
+    Stands in for ask_sdk_dynamodb's adapter, which builds an untuned
+    DynamoDb resource as soon as it is imported.
+    """
+
+    BATCH_GET_LIMIT = 100
+
+    def __init__(
+        self,
+        table_name,
+        dynamodb_resource,
+        partition_key_name="id",
+        attribute_name="attributes",
+        create_table=False,
+        compress=False,
+        read_legacy=True,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.table_name = table_name
+        self.dynamodb = dynamodb_resource
+        self.partition_key_name = partition_key_name
+        self.attribute_name = attribute_name
+        self.create_table = create_table
+        self.compress = compress
+        self.read_legacy = read_legacy
+        if create_table:
+            self.create_missing_table()
+
+    def create_missing_table(self):
+        try:
+            self.dynamodb.create_table(
+                TableName=self.table_name,
+                KeySchema=[
+                    {"AttributeName": self.partition_key_name, "KeyType": "HASH"}
+                ],
+                AttributeDefinitions=[
+                    {"AttributeName": self.partition_key_name, "AttributeType": "S"}
+                ],
+                ProvisionedThroughput={"ReadCapacityUnits": 5, "WriteCapacityUnits": 5},
+            )
+        except Exception as exc:
+            if type(exc).__name__ != "ResourceInUseException":
+                raise self.failed("create table for", exc)
+
+    @property
+    def table(self):
+        return dynamodb_table(self.dynamodb, self.table_name)
+
+    @staticmethod
+    def failed(action, exc):
+        return PersistenceException(
+            f"Failed to {action} attributes in DynamoDb table. "
+            f"Exception of type {type(exc).__name__} occurred: {exc}"
+        )
+
+    def item_attributes(self, item):
+        if BLOB in item:
+            return decode(item[BLOB])
+        if self.read_legacy:
+            return item.get(self.attribute_name) or {}
+        return {}
+
+    def stored(self, attributes):
+        """Name and value of the item attribute holding `attributes`."""
+        if self.compress:
+            return BLOB, Binary(encode(attributes))
+        return self.attribute_name, attributes
+
+    def item(self, key, attributes, version=None):
+        name, value = self.stored(attributes)
+        item = {self.partition_key_name: key, name: value}
+        if version is not None:
+            item[VERSION] = version
+        return item
+
+    def read(self, key, consistent=False):
+        try:
+            response = self.table.get_item(
+                Key={self.partition_key_name: key}, ConsistentRead=consistent
+            )
+        except Exception as exc:
+            raise self.failed("retrieve", exc)
+
+        item = response.get("Item") or {}
+        return self.item_attributes(item), item.get(VERSION)
+
+    def read_latest(self, key):
+        return self.read(key, consistent=True)
+
+    def read_paths(self, key, paths):
+        """Project the read onto `paths` of the attribute map.
+
+        Compressed items can't be projected: when the item turns out to be
+        a blob it's read whole.
+        """
+        if self.compress or not self.read_legacy:
+            return super().read_paths(key, paths)
+
+        names = {"#attributes": self.attribute_name, "#blob": BLOB, "#version": VERSION}
+        projection = ["#version", "#blob"]
+        for index, path in enumerate(paths):
+            names[f"#p{index}"] = path
+            projection.append(f"#attributes.#p{index}")
+
+        try:
+            response = self.table.get_item(
+                Key={self.partition_key_name: key},
+                ProjectionExpression=", ".join(projection),
+                ExpressionAttributeNames=names,
+            )
+        except Exception as exc:
+            raise self.failed("retrieve", exc)
+
+        item = response.get("Item") or {}
+        if BLOB in item:
+            return decode(item[BLOB]), item.get(VERSION), False
+        return item.get(self.attribute_name) or {}, item.get(VERSION), True
+
+    def update(self, key, changed, removed, version):
+        names = {"#attributes": self.attribute_name, "#version": VERSION}
+        values = {":version": version, ":next": version + 1}
+        assignments = ["#version = :next"]
+        for index, (name, value) in enumerate(changed.items()):
+            names[f"#s{index}"] = name
+            values[f":s{index}"] = value
+            assignments.append(f"#attributes.#s{index} = :s{index}")
+        expression = "SET " + ", ".join(assignments)
+
+        deletions = []
+        for index, name in enumerate(removed):
+            names[f"#r{index}"] = name
+            deletions.append(f"#attributes.#r{index}")
+        if deletions:
+            expression += " REMOVE " + ", ".join(deletions)
+
+        try:
+            self.table.update_item(
+                Key={self.partition_key_name: key},
+                UpdateExpression=expression,
+                ConditionExpression="#version = :version",
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values,
+            )
+        except ClientError as exc:
+            if exc.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                raise VersionConflictError(key)
+            raise self.failed("save", exc)
+        except Exception as exc:
+            raise self.failed("save", exc)
+
+    def write(self, key, attributes, version):
+        params = {
+            "Item": self.item(key, attributes, (version or 0) + 1),
+            "ExpressionAttributeNames": {"#version": VERSION},
+        }
+        if version is None:
+            params["ConditionExpression"] = "attribute_not_exists(#version)"
+        else:
+            params["ConditionExpression"] = "#version = :version"
+            params["ExpressionAttributeValues"] = {":version": version}
+
+        try:
+            self.table.put_item(**params)
+        except ClientError as exc:
+            if exc.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                raise VersionConflictError(key)
+            raise self.failed("save", exc)
+        except Exception as exc:
+            raise self.failed("save", exc)
+
+    def remove(self, key):
+        try:
+            self.table.delete_item(Key={self.partition_key_name: key})
+        except Exception as exc:
+            raise self.failed("delete", exc)
+
+    def read_many(self, keys):
+        keys = list(keys)
+        attributes = {}
+        try:
+            for start in range(0, len(keys), self.BATCH_GET_LIMIT):
+                request = {
+                    self.table_name: {
+                        "Keys": [
+                            {self.partition_key_name: key}
+                            for key in keys[start : start + self.BATCH_GET_LIMIT]
+                        ]
+                    }
+                }
+                while request:
+                    response = self.dynamodb.batch_get_item(RequestItems=request)
+                    for item in response["Responses"].get(self.table_name, []):
+                        key = item[self.partition_key_name]
+                        attributes[key] = self.item_attributes(item)
+                    request = response.get("UnprocessedKeys")
+        except Exception as exc:
+            raise self.failed("retrieve", exc)
+        return attributes
+
+    def write_many(self, items, expires=None):
+        # One update per item: a batched put can't bump the version
+        names = {"#version": VERSION, "#blob": BLOB, "#attributes": self.attribute_name}
+        stored, dropped = "#attributes", "#blob"
+        if self.compress:
+            stored, dropped = dropped, stored
+        assignments = [f"{stored} = :stored"]
+        if expires is not None:
+            names["#expires"] = EXPIRES
+            assignments.append("#expires = :expires")
+        expression = f"SET {', '.join(assignments)} REMOVE {dropped} ADD #version :one"
+
+        try:
+            for key, attributes in items.items():
+                values = {":stored": self.stored(attributes)[1], ":one": 1}
+                if expires is not None:
+                    values[":expires"] = int(expires)
+                self.table.update_item(
+                    Key={self.partition_key_name: key},
+                    UpdateExpression=expression,
+                    ExpressionAttributeNames=names,
+                    ExpressionAttributeValues=values,
+                )
+        except Exception as exc:
+            raise self.failed("save", exc)
+
+
+class InMemoryAdapter(NoiseblendPersistenceAdapter):
+    """Process local backend for benchmarks and tests.
+
+    Pass the same `store` to every adapter that should share data.
+    """
+
+    def __init__(self, store=None, **kwargs):
+        super().__init__(**kwargs)
+        self.store = {} if store is None else store
+        self.lock = threading.Lock()
+
+    def read(self, key):
+        with self.lock:
+            version, attributes = self.store.get(key, (None, {}))
+            return deepcopy(attributes), version
+
+    def read_paths(self, key, paths):
+        with self.lock:
+            version, attributes = self.store.get(key, (None, {}))
+            projected = {path: attributes[path] for path in paths if path in attributes}
+            return deepcopy(projected), version, True
+
+    def write(self, key, attributes, version):
+        with self.lock:
+            stored_version = self.store.get(key, (None, None))[0]
+            if stored_version != version:
+                raise VersionConflictError(key)
+            self.store[key] = ((version or 0) + 1, deepcopy(attributes))
+
+    def update(self, key, changed, removed, version):
+        with self.lock:
+            stored_version, attributes = self.store.get(key, (None, {}))
+            if stored_version != version:
+                raise VersionConflictError(key)
+
+            attributes = dict(attributes, **deepcopy(changed))
+            for name in removed:
+                attributes.pop(name, None)
+            self.store[key] = (version + 1, attributes)
+
+    def remove(self, key):
+        with self.lock:
+            self.store.pop(key, None)
+
+    def write_many(self, items, expires=None):
+        with self.lock:
+            for key, attributes in items.items():
+                version = self.store.get(key, (None, None))[0]
+                self.store[key] = ((version or 0) + 1, deepcopy(attributes))
+
+
+def sqlite_connection(path):
+    connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS attributes "
+        "(id TEXT PRIMARY KEY, version INTEGER NOT NULL, data BLOB NOT NULL, "
+        "expires INTEGER)"
+    )
+    columns = [row[1] for row in connection.execute("PRAGMA table_info(attributes)")]
+    if EXPIRES not in columns:
+        connection.execute("ALTER TABLE attributes ADD COLUMN expires INTEGER")
+    return connection
+
+
+class SQLiteAdapter(NoiseblendPersistenceAdapter):
+    """Embedded backend for self-hosted deployments.
+
+    Attributes are stored with the compressed blob codec in a WAL mode
+    database. Pass a connection from :func:`sqlite_connection` to share it
+    between adapters.
+
+    Batched rows expire like DynamoDb items: they are hidden from reads
+    once past `expires` and purged by the next batched write.
+    """
+
+    LIVE = "(expires IS NULL OR expires > ?)"
+
+    def __init__(self, connection, **kwargs):
+        super().__init__(**kwargs)
+        self.connection = connection
+        self.lock = threading.Lock()
+
+    def select(self, key):
+        row = self.connection.execute(
+            f"SELECT version, data FROM attributes WHERE id = ? AND {self.LIVE}",
+            (key, int(time.time())),
+        ).fetchone()
+        if not row:
+            return {}, None
+        return decode(row[1]), row[0]
+
+    def read(self, key):
+        with self.lock:
+            return self.select(key)
+
+    def read_paths(self, key, paths):
+        attributes, version = self.read(key)
+        projected = {path: attributes[path] for path in paths if path in attributes}
+        return projected, version, True
+
+    def write_row(self, key, attributes, version):
+        """Write under the lock, conditional on the stored `version`."""
+        data = encode(attributes)
+        if version is None:
+            # An expired row doesn't count as existing
+            self.connection.execute(
+                f"DELETE FROM attributes WHERE id = ? AND NOT {self.LIVE}",
+                (key, int(time.time())),
+            )
+            try:
+                self.connection.execute(
+                    "INSERT INTO attributes (id, version, data) VALUES (?, 1, ?)",
+                    (key, data),
+                )
+            except sqlite3.IntegrityError:
+                raise VersionConflictError(key)
+            return
+
+        cursor = self.connection.execute(
+            "UPDATE attributes SET version = ?, data = ?, expires = NULL "
+            "WHERE id = ? AND version = ?",
+            (version + 1, data, key, version),
+        )
+        if cursor.rowcount != 1:
+            raise VersionConflictError(key)
+
+    def write(self, key, attributes, version):
+        with self.lock:
+            self.write_row(key, attributes, version)
+
+    def update(self, key, changed, removed, version):
+        with self.lock:
+            attributes, stored_version = self.select(key)
+            if stored_version != version:
+                raise VersionConflictError(key)
+
+            attributes.update(changed)
+            for name in removed:
+                attributes.pop(name, None)
+            self.write_row(key, attributes, version)
+
+    def remove(self, key):
+        with self.lock:
+            self.connection.execute("DELETE FROM attributes WHERE id = ?", (key,))
+
+    def read_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+
+        placeholders = ", ".join("?" for _ in keys)
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT id, data FROM attributes "
+                f"WHERE id IN ({placeholders}) AND {self.LIVE}",
+                keys + [int(time.time())],
+            ).fetchall()
+        return {key: decode(data) for key, data in rows}
+
+    def write_many(self, items, expires=None):
+        rows = [(key, encode(attributes)) for key, attributes in items.items()]
+        with self.lock:
+            self.connection.execute("BEGIN")
+            try:
+                self.connection.execute(
+                    f"DELETE FROM attributes WHERE NOT {self.LIVE}", (int(time.time()),)
+                )
+                for key, data in rows:
+                    updated = self.connection.execute(
+                        "UPDATE attributes SET version = version + 1, data = ?, "
+                        "expires = ? WHERE id = ?",
+                        (data, expires, key),
+                    )
+                    if updated.rowcount == 0:
+                        self.connection.execute(
+                            "INSERT INTO attributes (id, version, data, expires) "
+                            "VALUES (?, 1, ?, ?)",
+                            (key, data, expires),
+                        )
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
@@ -0,0 +1,87 @@
+import time
+
+from .constants import PLAYLIST_CACHE_SIZE, PLAYLIST_CACHE_TTL
+
+# Promised to be fresh every time
+UNCACHED_BLENDS = ("random",)
+
+
+def tuning_vector(attributes):
+    """Canonical form of a tuning profile, independent of order and float noise."""
+    if not attributes:
+        return ""
+    return ",".join(
+        f"{tuneable}={float(value):.2f}"
+        for tuneable, value in sorted(attributes.items())
+    )
+
+
+class PlaylistCache:
+    """Playlists generated for a blend and tuning vector, reused until they expire.
+
+    Kept in persistent attributes as `playlists: {key: {"id", "expires",
+    "attributes"}}`, with the tuning the playlist was generated with so a
+    reused playlist can restore it.
+    Disabled unless `ttl` (NOISEBLEND_PLAYLIST_CACHE_TTL) is positive, and
+    never used for the blends in UNCACHED_BLENDS.
+    """
+
+    def __init__(self, attr, ttl=PLAYLIST_CACHE_TTL, max_playlists=PLAYLIST_CACHE_SIZE):
+        self.attr = attr
+        self.ttl = ttl
+        self.max_playlists = max_playlists
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def cacheable(self, blend_id):
+        return self.enabled and blend_id not in UNCACHED_BLENDS
+
+    @property
+    def playlists(self):
+        return self.attr.get("playlists") or {}
+
+    @staticmethod
+    def key(blend_id, attributes):
+        return f"{blend_id}|{tuning_vector(attributes)}"
+
+    def prune(self):
+        now = time.time()
+        for key, playlist in list(self.playlists.items()):
+            if playlist["expires"] < now:
+                del self.playlists[key]
+
+        by_expiry = sorted(self.playlists, key=lambda k: self.playlists[k]["expires"])
+        for key in by_expiry[: max(len(by_expiry) - self.max_playlists, 0)]:
+            del self.playlists[key]
+
+    def get(self, blend_id, attributes):
+        """The cached `{"id", "expires", "attributes"}` entry, if still fresh."""
+        if not self.cacheable(blend_id):
+            return None
+
+        playlist = self.playlists.get(self.key(blend_id, attributes))
+        if not playlist or playlist["expires"] < time.time():
+            return None
+        return playlist
+
+    def put(self, blend_id, attributes, playlist_id, generated=None):
+        """Cache `playlist_id` generated for `attributes`, resolved to `generated`."""
+        if not self.cacheable(blend_id):
+            return
+        if not self.attr.get("playlists"):
+            self.attr["playlists"] = {}
+        self.attr["playlists"][self.key(blend_id, attributes)] = {
+            "id": playlist_id,
+            "expires": int(time.time() + self.ttl),
+            "attributes": {
+                tuneable: f"{float(value):.2f}"
+                for tuneable, value in (generated or {}).items()
+            },
+        }
+        self.prune()
+
+    def clear(self):
+        if self.attr.get("playlists"):
+            self.attr["playlists"] = {}
@@ -0,0 +1,173 @@
+"""Memory and CPU profiling of the Lambda container.
+
+Set NOISEBLEND_MEMORY_REPORT=1 to log, for every invocation, how much the
+resident set grew while it ran and the high-water mark of the container so
+far against the configured Lambda memory size. With NOISEBLEND_TRACEMALLOC=1
+(started in blend.py, before anything is imported) the report also
+attributes the allocations still alive to the packages that made them.
+
+Set NOISEBLEND_PROFILE_RATE to the fraction of requests (e.g. 0.01) that
+should run under cProfile and log their cumulative hotspots.
+"""
+
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import resource
+import sys
+import tracemalloc
+from contextlib import contextmanager
+
+from .constants import MEMORY_REPORT, MEMORY_REPORT_TOP, PROFILE_RATE, PROFILE_TOP
+
+logger = logging.getLogger(__name__)
+
+SITE_DIRS = sorted(
+    {os.path.abspath(path) for path in sys.path if path and os.path.isdir(path)},
+    key=len,
+    reverse=True,
+)
+
+
+def max_rss_mb():
+    """High-water resident set size since the container started, in MB.
+
+    `ru_maxrss` never goes down, so in a warm container this is the worst
+    invocation so far, not the current one.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / 1024 / 1024
+    return peak / 1024
+
+
+def rss_mb():
+    """Current resident set size in MB, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * resource.getpagesize() / 1024 / 1024
+
+
+def memory_size_mb():
+    size = os.getenv("AWS_LAMBDA_FUNCTION_MEMORY_SIZE")
+    return int(size) if size else None
+
+
+def relative_source(filename):
+    """Source path relative to the entry of `sys.path` it was imported from."""
+    if filename.startswith("<") or filename == "~":
+        return filename
+    filename = os.path.abspath(filename)
+    for site_dir in SITE_DIRS:
+        if filename.startswith(site_dir + os.sep):
+            return filename[len(site_dir) + 1 :]
+    return filename
+
+
+def module_of(filename):
+    """Top-level package a source file belongs to, e.g. `ask_sdk_model`."""
+    source = relative_source(filename)
+    if os.path.isabs(source) or source.startswith("<"):
+        return source
+
+    top = source.split(os.sep, 1)[0]
+    return top[:-3] if top.endswith(".py") else top
+
+
+def start_tracing(frames=1):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def allocations_by_module(snapshot=None, top=MEMORY_REPORT_TOP):
+    """Bytes and blocks alive per top-level package, largest first."""
+    if snapshot is None:
+        snapshot = tracemalloc.take_snapshot()
+
+    modules = {}
+    for stat in snapshot.statistics("filename"):
+        name = module_of(stat.traceback[0].filename)
+        size, count = modules.get(name, (0, 0))
+        modules[name] = (size + stat.size, count + stat.count)
+
+    by_size = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)
+    return [
+        {"module": name, "kb": round(size / 1024, 1), "blocks": count}
+        for name, (size, count) in by_size[:top]
+    ]
+
+
+def memory_report(request_type=None, start_rss_mb=None):
+    """Memory of the container, and its growth since `start_rss_mb` if given."""
+    report = {"request_type": request_type, "max_rss_mb": round(max_rss_mb(), 1)}
+
+    current = rss_mb()
+    if current is not None:
+        report["rss_mb"] = round(current, 1)
+        if start_rss_mb is not None:
+            report["rss_growth_mb"] = round(current - start_rss_mb, 1)
+
+    size = memory_size_mb()
+    if size:
+        report["memory_size_mb"] = size
+        report["headroom_mb"] = round(size - report["max_rss_mb"], 1)
+
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        report["traced_mb"] = round(current / 1024 / 1024, 1)
+        report["traced_peak_mb"] = round(peak / 1024 / 1024, 1)
+        report["modules"] = allocations_by_module()
+    return report
+
+
+def log_memory_report(request_type=None, start_rss_mb=None):
+    if MEMORY_REPORT:
+        logger.info("Memory report: %s", memory_report(request_type, start_rss_mb))
+
+
+def hotspots(profiler, top=PROFILE_TOP):
+    """Functions with the highest cumulative time, as compact records."""
+    stats = pstats.Stats(profiler).sort_stats("cumulative")
+    spots = []
+    for func in stats.fcn_list[:top]:
+        filename, line, name = func
+        _, calls, total_time, cumulative_time = stats.stats[func][:4]
+        spots.append(
+            {
+                "fn": f"{relative_source(filename)}:{line}:{name}",
+                "calls": calls,
+                "cum_ms": round(cumulative_time * 1000, 2),
+                "own_ms": round(total_time * 1000, 2),
+            }
+        )
+    return spots
+
+
+@contextmanager
+def sampled_profile(handler_name, request_type, rate=PROFILE_RATE):
+    """Profile the block for a `rate` fraction of calls and log its hotspots."""
+    if rate <= 0 or random.random() >= rate:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        try:
+            record = {
+                "handler": handler_name,
+                "request_type": request_type,
+                "hotspots": hotspots(profiler),
+            }
+            logger.info("Profile: %s", json.dumps(record, separators=(",", ":")))
+        except Exception as exc:
+            logger.exception(exc)
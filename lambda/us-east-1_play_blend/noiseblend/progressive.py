@@ -0,0 +1,82 @@
+import logging
+import threading
+
+from ask_sdk_model.services.directive import (
+    Header,
+    SendDirectiveRequest,
+    SpeakDirective,
+)
+
+from .constants import PROGRESSIVE_RESPONSE_AFTER
+
+logger = logging.getLogger(__name__)
+
+SPEAKING_REQUESTS = ("IntentRequest", "LaunchRequest")
+
+
+class ProgressiveResponse:
+    """Speaks an interim line through the directive service when the block
+    it wraps runs longer than `after` seconds.
+
+    Leaving the block waits for a send already under way and stops any
+    later one, so the interim line never follows the final response.
+    """
+
+    def __init__(self, handler_input, speech, after=PROGRESSIVE_RESPONSE_AFTER):
+        self.handler_input = handler_input
+        self.speech = speech
+        self.after = after
+        self.timer = None
+        self.lock = threading.Lock()
+        self.closed = False
+        self.delivered = threading.Event()
+
+    @property
+    def sent(self):
+        return self.delivered.is_set()
+
+    @property
+    def available(self):
+        envelope = self.handler_input.request_envelope
+        return (
+            self.after >= 0
+            and self.handler_input.service_client_factory is not None
+            and bool(envelope.context.system.api_access_token)
+            and envelope.request.object_type in SPEAKING_REQUESTS
+        )
+
+    def send(self):
+        with self.lock:
+            if not self.closed:
+                self.enqueue()
+
+    def enqueue(self):
+        request_id = self.handler_input.request_envelope.request.request_id
+        try:
+            directive_service = (
+                self.handler_input.service_client_factory.get_directive_service()
+            )
+            directive_service.enqueue(
+                SendDirectiveRequest(
+                    header=Header(request_id=request_id),
+                    directive=SpeakDirective(speech=self.speech),
+                )
+            )
+            self.delivered.set()
+        except Exception as exc:
+            logger.warning("Progressive response failed: %s", exc)
+
+    def __enter__(self):
+        if self.available:
+            self.timer = threading.Timer(self.after, self.send)
+            self.timer.daemon = True
+            self.timer.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.timer is None:
+            return
+        self.timer.cancel()
+        with self.lock:
+            self.closed = True
+        self.timer.join()
@@ -0,0 +1,82 @@
+from .constants import RADIO_SEED_CACHE_SIZE
+
+SEED_KINDS = ("artist", "track", "genre")
+
+
+def seed_key(name):
+    return name.strip().lower()
+
+
+class RadioSeedCache:
+    """Spotify IDs of radio seeds the backend already resolved from spoken names.
+
+    Kept in persistent attributes as `radio_seeds: {kind: {name: id}}` so
+    replays and repeated requests send IDs and skip the backend search.
+    """
+
+    def __init__(self, attr, max_seeds=RADIO_SEED_CACHE_SIZE):
+        self.attr = attr
+        self.max_seeds = max_seeds
+
+    @property
+    def seeds(self):
+        return self.attr.get("radio_seeds") or {}
+
+    def params(self, seeds):
+        """Request parameters sending known IDs in place of seed names."""
+        params = {}
+        for kind in SEED_KINDS:
+            names = seeds.get(f"{kind}_names") or []
+            stored_ids = seeds.get(f"{kind}_ids") or []
+            if names and len(stored_ids) == len(names):
+                params[f"{kind}_ids"] = list(stored_ids)
+                continue
+
+            known = self.seeds.get(kind) or {}
+            ids = [known[seed_key(name)] for name in names if seed_key(name) in known]
+            unknown = [name for name in names if seed_key(name) not in known]
+            if ids:
+                params[f"{kind}_ids"] = ids
+            if unknown:
+                params[f"{kind}_names"] = unknown
+        return params
+
+    def learn(self, params, resolved):
+        """Remember IDs the backend resolved for the names sent in `params`.
+
+        `resolved` are the backend's seed objects (`{"id", "type"}`) in
+        request order. Names are only matched when the count is unambiguous.
+        """
+        learned = False
+        for kind in SEED_KINDS:
+            names = params.get(f"{kind}_names") or []
+            sent_ids = set(params.get(f"{kind}_ids") or [])
+            ids = [
+                seed["id"]
+                for seed in resolved
+                if isinstance(seed, dict)
+                and str(seed.get("type", "")).lower() == kind
+                and seed.get("id")
+                and seed["id"] not in sent_ids
+            ]
+            if not names or len(ids) != len(names):
+                continue
+
+            if not self.attr.get("radio_seeds"):
+                self.attr["radio_seeds"] = {}
+            known = self.attr["radio_seeds"].setdefault(kind, {})
+            for name, seed_id in zip(names, ids):
+                known[seed_key(name)] = seed_id
+            for name in list(known)[: max(len(known) - self.max_seeds, 0)]:
+                del known[name]
+            learned = True
+        return learned
+
+    def resolve(self, seeds):
+        """Add `<kind>_ids` to `seeds` for every kind whose names are all known."""
+        for kind in SEED_KINDS:
+            names = seeds.get(f"{kind}_names") or []
+            known = self.seeds.get(kind) or {}
+            if names and all(seed_key(name) in known for name in names):
+                seeds[f"{kind}_ids"] = [known[seed_key(name)] for name in names]
+        return seeds
@@ -0,0 +1,77 @@
+import time
+from collections import OrderedDict
+
+from .constants import (
+    RATE_LIMIT_BURST,
+    RATE_LIMIT_LOCAL_USERS,
+    RATE_LIMIT_PER_MINUTE,
+)
+
+# user id -> (tokens, updated), the container's view of recent buckets
+local_buckets = OrderedDict()
+
+
+class TokenBucket:
+    """Per-user token bucket limiting playlist regenerations.
+
+    The bucket is kept in persistent attributes as
+    `rate_limit: {"tokens": "<float>", "updated": <epoch ms>}` so it holds
+    across containers. A copy is kept in the container, and a user whose
+    local bucket is empty is refused without looking at the stored one.
+    """
+
+    def __init__(
+        self,
+        attr,
+        user_id,
+        burst=RATE_LIMIT_BURST,
+        per_minute=RATE_LIMIT_PER_MINUTE,
+        local=local_buckets,
+    ):
+        self.attr = attr
+        self.user_id = user_id
+        self.burst = burst
+        self.rate = per_minute / 60
+        self.local = local
+
+    @property
+    def enabled(self):
+        return self.burst > 0
+
+    def level(self, tokens, updated, now):
+        return min(self.burst, tokens + max(now - updated, 0) * self.rate)
+
+    def stored(self):
+        state = self.attr.get("rate_limit")
+        if not state:
+            return self.burst, 0
+        return float(state["tokens"]), int(state["updated"]) / 1000
+
+    def remember(self, tokens, now):
+        self.local[self.user_id] = (tokens, now)
+        self.local.move_to_end(self.user_id)
+        while len(self.local) > RATE_LIMIT_LOCAL_USERS:
+            self.local.popitem(last=False)
+
+    def take(self):
+        """Use up one token, returning False when the bucket is empty."""
+        if not self.enabled:
+            return True
+
+        now = time.time()
+        if self.user_id in self.local:
+            if self.level(*self.local[self.user_id], now) < 1:
+                return False
+
+        tokens = self.level(*self.stored(), now)
+        if tokens < 1:
+            self.remember(tokens, now)
+            return False
+
+        tokens -= 1
+        self.attr["rate_limit"] = {
+            "tokens": f"{tokens:.3f}",
+            "updated": int(now * 1000),
+        }
+        self.remember(tokens, now)
+        return True
@@ -0,0 +1,80 @@
+"""Error reporting to Sentry, kept off the response path.
+
+Every exception is captured at most once, however many handlers see it.
+Events queue in Sentry's background transport (bounded by
+SENTRY_QUEUE_SIZE) and are only flushed at the end of an invocation that
+queued something, for as long as the remaining Lambda time allows. Events
+are counted as they are handed to the transport, so ones sent by the
+logging integration for `logger.exception` count as well.
+Whatever doesn't make it is sent when the container thaws again.
+"""
+
+import logging
+
+import sentry_sdk
+from sentry_sdk.integrations.aws_lambda import AwsLambdaIntegration
+
+from .constants import (
+    SENTRY_FLUSH_MARGIN,
+    SENTRY_FLUSH_TIMEOUT,
+    SENTRY_QUEUE_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+CAPTURED = "_noiseblend_captured"
+
+pending = 0
+
+
+def queued(event, hint):
+    """Count every event that reaches the transport, whoever captured it."""
+    global pending
+
+    pending += 1
+    return event
+
+
+def init_sentry(dsn_file, **options):
+    if not dsn_file.exists():
+        logger.warning("Sentry DSN not found at %s, not reporting errors", dsn_file)
+        return
+
+    sentry_sdk.init(
+        dsn_file.read_text().strip(),
+        integrations=[AwsLambdaIntegration()],
+        transport_queue_size=SENTRY_QUEUE_SIZE,
+        # The integration flushes after every invocation, we flush ourselves
+        shutdown_timeout=0,
+        before_send=queued,
+        **options,
+    )
+
+
+def capture(exc):
+    """Send `exc` to Sentry unless it was already sent."""
+    if getattr(exc, CAPTURED, False):
+        return
+    try:
+        setattr(exc, CAPTURED, True)
+    except AttributeError:
+        pass
+
+    sentry_sdk.capture_exception(exc)
+
+
+def flush(context=None):
+    """Flush queued events within the time the invocation has left."""
+    global pending
+
+    if not pending:
+        return
+
+    timeout = SENTRY_FLUSH_TIMEOUT
+    if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+        remaining = context.get_remaining_time_in_millis() / 1000
+        timeout = min(timeout, remaining - SENTRY_FLUSH_MARGIN)
+
+    if timeout > 0:
+        sentry_sdk.flush(timeout=timeout)
+    pending = 0
@@ -1,16 +1,22 @@
+import json
 import logging
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from copy import deepcopy
 from functools import lru_cache
 
 import addict
-import requests
 import stringcase
 from first import first
 from fuzzywuzzy import fuzz
-from sentry_sdk import capture_exception, configure_scope
+from sentry_sdk import configure_scope
 
-from ask_sdk.standard import StandardSkillBuilder
+from ask_sdk_core.api_client import DefaultApiClient
 from ask_sdk_core.dispatch_components import AbstractRequestHandler
+from ask_sdk_core.skill_builder import SkillBuilder
 from ask_sdk_core.utils import is_intent_name, is_request_type
 from ask_sdk_model.canfulfill import CanFulfillIntentRequest
 from ask_sdk_model.dialog import ElicitSlotDirective
@@ -20,89 +26,333 @@ from ask_sdk_model.ui.image import Image
 from ask_sdk_runtime.dispatch_components.request_components import GenericHandlerAdapter
 from aws_xray_sdk.core import xray_recorder
 
+from . import client
 from .constants import (
     CHOOSE_DEVICE,
+    EVERYWHERE,
+    FINDING_SPEAKERS,
+    MIXING_BLEND,
+    COMPRESS_ATTRIBUTES,
+    MEMORY_REPORT,
     MISSING_DEVICE,
+    MULTI_ROOM_MAX_DEVICES,
     NO_DEVICES,
     NOISEBLEND_IMG,
     NOTIFY_LINK_ACCOUNT,
+    NOTIFY_RELINK_ACCOUNT,
+    PERSIST_IDEMPOTENCY,
+    PERSISTENCE_BACKEND,
     PLAYING_BLEND,
+    PLAYING_BLEND_ROOMS,
     PLAYING_RADIO,
     PLAYING_RANDOM,
-    WHAT_DEVICE,
+    PREFETCH_MAX_SESSIONS,
+    PREFETCH_TTL,
+    PREFETCH_WAIT,
+    PREFETCH_WORKERS,
+    READ_LEGACY_ATTRIBUTES,
+    SQLITE_PATH,
+    WRITE_BEHIND_CHECKPOINT,
+    WRITE_BEHIND_MAX_BYTES,
+    WRITE_BEHIND_MAX_TURNS,
 )
 from .exceptions import UnknownSlotError
 from .helpers import cap
-
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-
-
-def api(path):
-    return f"https://api.noiseblend.com/{path}"
+from .idempotency import IdempotencyStore
+from .logs import sampled
+from .persistence import (
+    InMemoryAdapter,
+    NoiseblendDynamoDbAdapter,
+    SQLiteAdapter,
+    dynamodb_resource,
+    sqlite_connection,
+)
+from .playlists import PlaylistCache
+from .profiling import log_memory_report, rss_mb, sampled_profile
+from .progressive import ProgressiveResponse
+from .radio import RadioSeedCache
+from .ratelimit import TokenBucket
+from .reporting import capture, flush
+from .slot_index import slot_index
+from .speakers import SpeakerPreferences
+from .tokens import token_expired
+from .tuning import TuningStore
+from .warmup import is_warmup, warm_up
+
+logger = logging.getLogger(__name__)
+diagnostics = sampled(logger)
+
+# Background fetches per session, user and token, started on one turn for the next
+prefetches = OrderedDict()
+prefetcher = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS)
+
+
+PREFETCHABLE = {"devices": {"playback": False}}
+WRITE_BEHIND = "write_behind"
+ROOMS = "rooms"
+ROOM_SEPARATOR = re.compile(r"\s*(?:,|&|\band\b)\s*", re.IGNORECASE)
+
+
+def awaits_reply(response):
+    """Whether `response` keeps the session open and reprompts the user.
+
+    Only then is another request of the session, a reply or a
+    SessionEndedRequest, sure to follow.
+    """
+    return (
+        response is not None
+        and response.should_end_session is False
+        and response.reprompt is not None
+    )
+
+
+def write_behind(handler_input):
+    """Persistent attributes kept in the session while it stays open, if any."""
+    if handler_input.request_envelope.session is None:
+        return None
+    session_attr = handler_input.attributes_manager.session_attributes or {}
+    return session_attr.get(WRITE_BEHIND)
 
 
 class NoiseblendHandlerAdapter(GenericHandlerAdapter):
+    def __init__(self, persistence_adapter=None):
+        super().__init__()
+        self.persistence_adapter = persistence_adapter
+
     @staticmethod
-    def serialize_tuneables(handler):
-        attrs = deepcopy(handler.attr["attributes"])
+    def serialize_tuneables(attributes):
+        attrs = deepcopy(attributes["attributes"])
         for thing, tuneables in attrs.items():
             for tuneable, value in tuneables.items():
                 if not isinstance(value, str):
-                    handler.attr["attributes"][thing][tuneable] = f"{value:.2f}"
+                    attributes["attributes"][thing][tuneable] = f"{value:.2f}"
 
-    def save_attributes(self, handler):
+    @staticmethod
+    def should_write_behind(response, pending, attributes):
+        """Whether to keep deferring the write while the session stays open.
+
+        Any response that may end the session flushes what's pending. A
+        session can still be dropped without a SessionEndedRequest, so
+        deferral also stops after a few turns, a checkpoint interval or once
+        the attributes get too big to carry in the session.
+        """
+        if not awaits_reply(response):
+            return False
+        if pending and (
+            pending.get("turns", 1) >= WRITE_BEHIND_MAX_TURNS
+            or time.time() - pending["since"] >= WRITE_BEHIND_CHECKPOINT
+        ):
+            return False
+        return len(json.dumps(attributes, default=str)) <= WRITE_BEHIND_MAX_BYTES
+
+    def save_attributes(self, handler_input, response):
+        xray_recorder.begin_subsegment("Saving attributes")
         try:
-            segment = xray_recorder.current_subsegment()
-            segment.put_metadata("attributes", handler.attr)
-
-            if "attributes" in handler.attr:
-                self.serialize_tuneables(handler)
+            manager = handler_input.attributes_manager
+            pending = write_behind(handler_input)
+            if pending:
+                manager.persistent_attributes = pending["attributes"]
+            attributes = manager.persistent_attributes
 
-            handler.handler_input.attributes_manager.save_persistent_attributes()
+            segment = xray_recorder.current_subsegment()
+            segment.put_metadata("attributes", attributes)
+
+            if "attributes" in attributes:
+                self.serialize_tuneables(attributes)
+
+            envelope = handler_input.request_envelope
+            versioned = hasattr(self.persistence_adapter, "loaded_version")
+            # A projected load can't stand in for the whole item on a later turn
+            projected = (
+                versioned
+                and not pending
+                and self.persistence_adapter.loaded_paths(envelope) is not None
+            )
+            if not projected and self.should_write_behind(
+                response, pending, attributes
+            ):
+                if pending:
+                    version = pending.get("version")
+                elif versioned:
+                    version = self.persistence_adapter.loaded_version(envelope)
+                else:
+                    version = None
+
+                manager.session_attributes[WRITE_BEHIND] = {
+                    "attributes": attributes,
+                    "since": pending["since"] if pending else time.time(),
+                    "turns": pending.get("turns", 1) + 1 if pending else 1,
+                    "version": version,
+                }
+                return
+
+            if pending:
+                del manager.session_attributes[WRITE_BEHIND]
+                if versioned:
+                    self.persistence_adapter.expect_version(
+                        envelope, pending.get("version")
+                    )
+            manager.save_persistent_attributes()
         except Exception as exc:
             logger.exception(exc)
-            capture_exception(exc)
+            capture(exc)
         finally:
             xray_recorder.end_subsegment()
 
     def execute(self, handler_input, handler):
         xray_recorder.begin_subsegment("Handling request")
+        if hasattr(self.persistence_adapter, "project"):
+            self.persistence_adapter.project(
+                handler_input.request_envelope,
+                getattr(handler, "attribute_paths", None),
+            )
+
         try:
-            response = handler.handle(handler_input)
-            segment = xray_recorder.current_subsegment()
+            with sampled_profile(
+                handler.__class__.__name__,
+                handler_input.request_envelope.request.object_type,
+            ):
+                response = handler.handle(handler_input)
+                segment = xray_recorder.current_subsegment()
 
-            if response:
-                segment.put_metadata("response", response.to_dict())
-            else:
-                segment.put_metadata("response", response)
+                if response:
+                    segment.put_metadata("response", response.to_dict())
+                else:
+                    segment.put_metadata("response", response)
 
-            if getattr(handler, "should_save_attr", False):
-                xray_recorder.begin_subsegment("Saving attributes")
-                self.save_attributes(handler)
+                if getattr(handler, "should_save_attr", False) or write_behind(
+                    handler_input
+                ):
+                    self.save_attributes(handler_input, response)
         except Exception as exc:
             logger.exception(exc)
-            capture_exception(exc)
+            capture(exc)
+            if write_behind(handler_input):
+                self.save_attributes(handler_input, None)
             raise exc
         finally:
+            if hasattr(self.persistence_adapter, "forget"):
+                self.persistence_adapter.forget(handler_input.request_envelope)
             xray_recorder.end_subsegment()
 
         return response
 
 
-class NoiseblendSkillBuilder(StandardSkillBuilder):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+class NoiseblendSkillBuilder(SkillBuilder):
+    """Skill builder with a pluggable persistence backend.
+
+    Takes the arguments of ask_sdk's StandardSkillBuilder, without ever
+    creating its stock DynamoDb adapter. `backend` is one of `dynamodb`
+    (using `table_name`), `memory` or `sqlite` (using `sqlite_path`).
+    `api_client` replaces the default client for Alexa service APIs.
+    """
+
+    BACKENDS = ("dynamodb", "memory", "sqlite")
+
+    def __init__(
+        self,
+        table_name=None,
+        auto_create_table=None,
+        partition_keygen=None,
+        dynamodb_client=None,
+        backend=PERSISTENCE_BACKEND,
+        sqlite_path=SQLITE_PATH,
+        compress_attributes=COMPRESS_ATTRIBUTES,
+        read_legacy_attributes=READ_LEGACY_ATTRIBUTES,
+        persist_idempotency=PERSIST_IDEMPOTENCY,
+        api_client=None,
+    ):
+        super().__init__()
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown persistence backend {backend}")
+
+        self.backend = backend
+        self.sqlite_path = sqlite_path
+        self.sqlite = None
+        self.memory_store = {}
+        self.compress_attributes = compress_attributes
+        self.read_legacy_attributes = read_legacy_attributes
+        self.persist_idempotency = persist_idempotency
+        self.table_name = table_name
+        self.auto_create_table = auto_create_table
+        self.partition_keygen = partition_keygen
+        self.dynamodb_client = dynamodb_client
+        self.api_client = api_client
+
+    def dynamodb_adapter(self):
+        kwargs = {
+            "table_name": self.table_name,
+            "compress": self.compress_attributes,
+            "read_legacy": self.read_legacy_attributes,
+        }
+        if self.auto_create_table:
+            kwargs["create_table"] = self.auto_create_table
+        if self.partition_keygen:
+            kwargs["partition_keygen"] = self.partition_keygen
+        kwargs["dynamodb_resource"] = self.dynamodb_client or dynamodb_resource()
+        return NoiseblendDynamoDbAdapter(**kwargs)
+
+    def persistence_adapter(self):
+        if self.backend == "dynamodb":
+            return self.dynamodb_adapter() if self.table_name is not None else None
+
+        kwargs = {}
+        if self.partition_keygen:
+            kwargs["partition_keygen"] = self.partition_keygen
+
+        if self.backend == "memory":
+            return InMemoryAdapter(store=self.memory_store, **kwargs)
+
+        if self.sqlite is None:
+            self.sqlite = sqlite_connection(self.sqlite_path)
+        return SQLiteAdapter(self.sqlite, **kwargs)
 
     @property
     def skill_configuration(self):
         skill_config = super().skill_configuration
-        skill_config.handler_adapters = [NoiseblendHandlerAdapter()]
+        skill_config.persistence_adapter = self.persistence_adapter()
+        skill_config.api_client = self.api_client or DefaultApiClient()
+        skill_config.handler_adapters = [
+            NoiseblendHandlerAdapter(skill_config.persistence_adapter)
+        ]
         return skill_config
 
+    def lambda_handler(self):
+        handler = super().lambda_handler()
+        idempotency = IdempotencyStore(
+            self.persistence_adapter() if self.persist_idempotency else None
+        )
+
+        def wrapper(event, context):
+            if is_warmup(event):
+                return warm_up(self.persistence_adapter())
+
+            request = event.get("request") or {}
+            request_id = request.get("requestId")
+            # Only intents call the Noiseblend API, the rest is cheap to redo
+            durable = request.get("type") == "IntentRequest"
+            response = idempotency.get(request_id, durable)
+            if response is not None:
+                logger.info("Replaying response of duplicate request %s", request_id)
+                return response
+
+            start_rss = rss_mb() if MEMORY_REPORT else None
+            try:
+                response = handler(event, context)
+            finally:
+                flush(context)
+            idempotency.put(request_id, response, durable)
+            log_memory_report(request.get("type"), start_rss)
+            return response
+
+        return wrapper
+
 
 # pylint: disable=too-many-public-methods
 class NoiseblendRequestHandler(AbstractRequestHandler):
+    # Top-level persistent attributes the handler reads, all of them when None
+    attribute_paths = None
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.token = None
@@ -113,6 +363,7 @@ class NoiseblendRequestHandler(AbstractRequestHandler):
         self.last_attributes = {}
         self.last_thing = None
         self.should_save_attr = False
+        self.progress = None
 
     def can_handle(self, handler_input):
         handler_name = self.__class__.__name__[:-7]
@@ -120,16 +371,22 @@ class NoiseblendRequestHandler(AbstractRequestHandler):
             handler_name
         )(handler_input)
 
-    def api_get(self, path, **params):
-        resp = requests.get(
-            api(path), headers={"Authorization": f"Bearer {self.token}"}, params=params
+    def api_get(self, path, token=None, **params):
+        resp = client.request(
+            "GET",
+            path,
+            headers={"Authorization": f"Bearer {token or self.token}"},
+            params=params,
         )
         resp.raise_for_status()
         return resp
 
     def api_post(self, path, **params):
-        resp = requests.post(
-            api(path), headers={"Authorization": f"Bearer {self.token}"}, json=params
+        resp = client.request(
+            "POST",
+            path,
+            headers={"Authorization": f"Bearer {self.token}"},
+            json=params,
         )
         resp.raise_for_status()
         return resp
@@ -140,27 +397,60 @@ class NoiseblendRequestHandler(AbstractRequestHandler):
 
     @property
     def attr(self):
+        pending = self.session_attr.get(WRITE_BEHIND)
+        if pending:
+            return pending["attributes"]
         if self.handler_input.attributes_manager.persistent_attributes is None:
             self.handler_input.attributes_manager.persistent_attributes = {}
         return self.handler_input.attributes_manager.persistent_attributes
 
+    @property
+    def in_dialog(self):
+        """Whether this request continues a session the user opened earlier."""
+        session = self.req_envelope.session
+        return session is not None and not session.new
+
+    @property
+    def session_attr(self):
+        if self.req_envelope.session is None:
+            return {}
+        if self.handler_input.attributes_manager.session_attributes is None:
+            self.handler_input.attributes_manager.session_attributes = {}
+        return self.handler_input.attributes_manager.session_attributes
+
+    @property
+    def tuning(self):
+        return TuningStore(self.attr)
+
     @property
     def req_attr(self):
         if self.handler_input.attributes_manager.request_attributes is None:
             self.handler_input.attributes_manager.request_attributes = {}
         return self.handler_input.attributes_manager.request_attributes
 
-    @staticmethod
-    def resolution(slot, raise_exc=True):
+    def resolution(self, slot, raise_exc=True):
         res = first(
-            slot.resolutions.resolutions_per_authority,
+            (slot.resolutions and slot.resolutions.resolutions_per_authority) or [],
             key=lambda r: r.status.code == StatusCode.ER_SUCCESS_MATCH,
         )
-        if not res:
-            if raise_exc:
-                raise UnknownSlotError(slot.name)
-            return None
-        return res.values[0].value
+        if res:
+            return res.values[0].value
+
+        value = self.local_resolution(slot)
+        if value:
+            return value
+
+        if raise_exc:
+            raise UnknownSlotError(slot.name)
+        return None
+
+    def local_resolution(self, slot):
+        index = slot_index()
+        slot_type = index.slot_type(self.req_envelope.request.intent.name, slot.name)
+        value = index.match(slot_type, slot.value)
+        if value:
+            logger.info("Resolved %s=%s locally as %s", slot.name, slot.value, value.id)
+        return value
 
     def slot(self, slot_name):
         if not self.slots:
@@ -170,6 +460,72 @@ class NoiseblendRequestHandler(AbstractRequestHandler):
     def save_attr(self):
         self.should_save_attr = True
 
+    @contextmanager
+    def progressive(self, speech):
+        """Speak `speech` if the block is slow, at most once per request."""
+        if self.progress is not None:
+            yield
+            return
+
+        self.progress = ProgressiveResponse(self.handler_input, speech)
+        try:
+            with self.progress:
+                yield
+        finally:
+            if not self.progress.sent:
+                self.progress = None
+
+    def prefetch_key(self):
+        """Prefetches belong to one session of one user with one token."""
+        session = self.req_envelope.session
+        if session is None:
+            return None
+        user_id = self.req_envelope.context.system.user.user_id
+        return (session.session_id, user_id, self.token)
+
+    def prefetch(self, *paths):
+        """Start fetching `paths` for the next turn of the session, without waiting.
+
+        The handler is shared by the whole container, so the token is taken
+        now rather than when the fetch runs. The results stay in the
+        container: a next turn landing elsewhere fetches again.
+        """
+        key = self.prefetch_key()
+        if key is None:
+            return
+
+        def fetch(path, token):
+            # Taken before the call, a freeze mid-fetch only makes it look older
+            started = time.time()
+            return self.api_get(path, token, **PREFETCHABLE[path]).json(), started
+
+        prefetches[key] = {
+            path: prefetcher.submit(fetch, path, self.token) for path in paths
+        }
+        while len(prefetches) > PREFETCH_MAX_SESSIONS:
+            prefetches.popitem(last=False)
+
+    def prefetched(self, path):
+        """The prefetched response for `path` if it's ready and fresh, else None."""
+        key = self.prefetch_key()
+        futures = prefetches.get(key) if key else None
+        if not futures or path not in futures:
+            return None
+
+        future = futures.pop(path)
+        if not futures:
+            del prefetches[key]
+
+        try:
+            result, fetched_at = future.result(timeout=PREFETCH_WAIT)
+        except Exception as exc:
+            logger.warning("Prefetching %s failed: %r", path, exc)
+            return None
+
+        if time.time() - fetched_at > PREFETCH_TTL:
+            return None
+        return result
+
     @property
     @lru_cache(maxsize=1)
     def isp_response(self):
@@ -182,28 +538,111 @@ class NoiseblendRequestHandler(AbstractRequestHandler):
         self.response_builder.speak(text).set_should_end_session(end_session)
         return self.response_builder.response
 
-    def play_blend(self, blend, speak=None, card=None, volume=None):
-        blend_attributes = self.get_tuneable_attributes(blend.id)
+    @property
+    def devices(self):
+        """Devices to play on: every requested room, or the single chosen device."""
+        return self.req_attr.get(ROOMS) or [self.req_attr.get(self.device_id)]
+
+    def generate_blend(self, blend, blend_attributes, volume=None):
+        """Generate and start the blend on the first device.
+
+        Returns the tuneable attributes and, when the API was asked to return
+        it, the generated playlist id.
+        """
+        playlists = PlaylistCache(self.attr)
+        return_playlist = playlists.cacheable(blend.id) or len(self.devices) > 1
+        params = {"return_playlist": True} if return_playlist else {}
         attributes = self.api_post(
             "blend",
             blend=blend.id,
             play=True,
             return_early=True,
-            device=self.req_attr.get(self.device_id),
+            device=self.devices[0],
             attributes=blend_attributes,
             volume=volume,
+            **params,
         ).json()
 
-        if not blend_attributes:
-            self.set_tuneable_attributes(blend.id, attributes)
-            self.save_attr()
+        playlist_id = None
+        if return_playlist and isinstance(attributes.get("attributes"), dict):
+            playlist_id = (attributes.get("playlist") or {}).get("id")
+            attributes = attributes["attributes"]
+            if playlists.cacheable(blend.id) and playlist_id:
+                playlists.put(blend.id, blend_attributes, playlist_id, attributes)
+                self.save_attr()
+
+        return attributes, playlist_id
+
+    def play_playlist(self, playlist, devices, volume=None):
+        """Start `playlist` on all `devices` concurrently, returning those that started.
+
+        Fails only if no device could start playing.
+        """
+        if len(devices) <= 1:
+            for device in devices:
+                self.api_post("play", playlist=playlist, device=device, volume=volume)
+            return list(devices)
+
+        with ThreadPoolExecutor(max_workers=len(devices)) as executor:
+            futures = {
+                executor.submit(
+                    self.api_post,
+                    "play",
+                    playlist=playlist,
+                    device=device,
+                    volume=volume,
+                ): device
+                for device in devices
+            }
+
+        started, errors = [], []
+        for future, device in futures.items():
+            try:
+                future.result()
+                started.append(device)
+            except Exception as exc:
+                logger.warning("Playing on %s failed: %s", device, exc)
+                errors.append(exc)
+        if not started:
+            raise errors[0]
+        return started
+
+    def play_blend(self, blend, speak=None, card=None, volume=None):
+        devices = self.devices
+        blend_attributes = self.get_tuneable_attributes(blend.id)
+        cached = PlaylistCache(self.attr).get(blend.id, blend_attributes)
+        if cached:
+            logger.info("Reusing playlist %s for blend %s", cached["id"], blend.id)
+            started = self.play_playlist(cached["id"], devices, volume=volume)
+            if not blend_attributes and cached.get("attributes"):
+                self.set_tuneable_attributes(blend.id, cached["attributes"])
+                self.save_attr()
+        else:
+            with self.progressive(MIXING_BLEND):
+                attributes, playlist = self.generate_blend(
+                    blend, blend_attributes, volume=volume
+                )
+                started = devices[:1]
+                if playlist:
+                    try:
+                        started += self.play_playlist(
+                            playlist, devices[1:], volume=volume
+                        )
+                    except Exception as exc:
+                        logger.warning("Playing on the other speakers failed: %s", exc)
+                elif len(devices) > 1:
+                    logger.warning("No playlist to share, playing on %s", devices[0])
+            if not blend_attributes:
+                self.set_tuneable_attributes(blend.id, attributes)
+                self.save_attr()
 
         if speak is None or speak is True:
-            speak = (
-                PLAYING_RANDOM
-                if blend.id == "random"
-                else PLAYING_BLEND.format(blend.name)
-            )
+            if blend.id == "random":
+                speak = PLAYING_RANDOM
+            elif len(started) > 1:
+                speak = PLAYING_BLEND_ROOMS.format(blend.name, len(started))
+            else:
+                speak = PLAYING_BLEND.format(blend.name)
         if card is None or card is True:
             card = (
                 self.card(
@@ -261,28 +700,47 @@ class NoiseblendRequestHandler(AbstractRequestHandler):
         return self.play_blend(random_blend, **kwargs)
 
     def play_radio(self, volume=None, **seeds):
-        self.api_post(
+        seed_cache = RadioSeedCache(self.attr)
+        params = seed_cache.params(seeds)
+        resp = self.api_post(
             "radio",
             return_early=True,
-            device=self.req_attr.get(self.device_id),
+            device=self.devices[0],
             attributes=self.get_tuneable_attributes("radio"),
             volume=volume,
-            **seeds,
+            **params,
         )
+
+        try:
+            data = resp.json()
+        except ValueError:
+            data = None
+        resolved = data.get("seeds") if isinstance(data, dict) else None
+        if not isinstance(resolved, list):
+            resolved = []
+
+        if seed_cache.learn(params, resolved) and "last_radio" in self.attr:
+            seed_cache.resolve(self.attr["last_radio"])
+            self.save_attr()
+
         return self.speak(PLAYING_RADIO)
 
     def get_tuneable_attributes(self, thing):
-        attributes = (self.attr.get("attributes") or {}).get(thing)
-        if attributes:
-            for key, val in attributes.items():
-                attributes[key] = float(val)
-        return attributes
+        return self.tuning.get(thing)
 
     def set_tuneable_attributes(self, thing, attributes):
-        if attributes:
-            for key, val in attributes.items():
-                attributes[key] = f"{val:.2f}"
-        self.attr["attributes"] = {thing: attributes}
+        self.tuning.set(thing, attributes)
+
+    def regenerate(self):
+        """Play the last thing again with the new settings, if not throttled."""
+        user_id = self.req_envelope.context.system.user.user_id
+        if not TokenBucket(self.attr, user_id).take():
+            logger.info("Throttled regeneration for %s", user_id)
+            return False
+
+        self.save_attr()
+        self.play_last_thing()
+        return True
 
     def play_last_thing(self):
         if "last_blend" in self.attr:
@@ -295,22 +753,82 @@ class NoiseblendRequestHandler(AbstractRequestHandler):
             self.play_random(speak=False, card=False)
 
     @xray_recorder.capture()
-    def save_speaker(self, speaker):
+    def save_speaker(self, speaker, learn=False):
         self.req_attr[self.device_id] = speaker.name
+        if learn:
+            SpeakerPreferences(self.attr, self.device_id).record(speaker.name)
+            self.save_attr()
+
+    def preferred_speaker(self, speakers):
+        name = SpeakerPreferences(self.attr, self.device_id).likely(speakers.keys())
+        if name:
+            logger.debug("Using %s, the speaker usually picked from here", name)
+            return speakers[name]
+        return None
 
     @xray_recorder.capture()
     def choose_speaker(self, speakers, device_slot):
         speaker_list = list(speakers.values())
 
-        device_name = device_slot.name
+        device_name = device_slot.value
         speaker = max(
             speaker_list, key=lambda s: fuzz.ratio(device_name.lower(), s.name.lower())
         )
         if speaker:
-            self.save_speaker(speaker)
+            self.save_speaker(speaker, learn=True)
             return None
 
-        return self.ask_device(speaker_list, MISSING_DEVICE)
+        return self.ask_device(speaker_list, MISSING_DEVICE.format(device_name))
+
+    def requested_rooms(self, device_slot):
+        """Device names asked for together, `[EVERYWHERE]`, or none for one device."""
+        if not device_slot or not device_slot.value:
+            return []
+
+        names = [name for name in ROOM_SEPARATOR.split(device_slot.value) if name]
+        if len(names) > 1:
+            return names
+
+        resolved = self.resolution(device_slot, raise_exc=False)
+        if resolved and resolved.id == EVERYWHERE:
+            return [EVERYWHERE]
+        return []
+
+    @xray_recorder.capture()
+    def choose_rooms(self, devices, device_slot):
+        """Save every requested device, returning whether the request named several."""
+        requested = self.requested_rooms(device_slot)
+        if not requested or not devices:
+            return False
+        if any(d.name.lower() == device_slot.value.lower() for d in devices):
+            return False
+
+        if requested == [EVERYWHERE]:
+            speakers = [d for d in devices if d.type == "Speaker"] or devices
+            rooms = sorted(
+                (d for d in speakers if not d.is_restricted),
+                key=lambda d: not d.is_active,
+            )
+        else:
+            rooms = []
+            for name in requested:
+                room = max(
+                    devices, key=lambda d: fuzz.ratio(name.lower(), d.name.lower())
+                )
+                if room not in rooms:
+                    rooms.append(room)
+                    SpeakerPreferences(self.attr, self.device_id).record(room.name)
+            self.save_attr()
+
+        rooms = rooms[:MULTI_ROOM_MAX_DEVICES]
+        if not rooms:
+            return False
+
+        logger.debug("Playing on %s", ", ".join(room.name for room in rooms))
+        if len(rooms) > 1:
+            self.req_attr[ROOMS] = [room.name for room in rooms]
+        self.save_speaker(rooms[0])
+        return True
 
     @xray_recorder.capture()
     def ask_device(self, speaker_list, message):
@@ -326,8 +844,11 @@ class NoiseblendRequestHandler(AbstractRequestHandler):
         device_slot = self.slot("device")
 
         try:
-            devices = self.api_get("devices", playback=False).json()
-            logger.info(devices)
+            devices = self.prefetched("devices")
+            if devices is None:
+                with self.progressive(FINDING_SPEAKERS):
+                    devices = self.api_get("devices", playback=False).json()
+            diagnostics.debug("Devices: %s", devices)
 
             devices = [addict.Dict(d) for d in devices]
 
@@ -339,26 +860,35 @@ class NoiseblendRequestHandler(AbstractRequestHandler):
                 del self.req_attr[self.device_id]
             return None
 
+        if self.choose_rooms(devices, device_slot):
+            return None
+
         speaker_list = list(speakers.values())
         not_speaker_list = list(not_speakers.values())
 
         if len(speaker_list) == 1:
-            logger.info("Found 1 speaker, using it as the playing device")
+            logger.debug("Found 1 speaker, using it as the playing device")
             self.save_speaker(speaker_list[0])
         elif len(speaker_list) > 1:
-            logger.info("Found %s speakers", len(speaker_list))
+            logger.debug("Found %s speakers", len(speaker_list))
             if self.device_id not in self.req_attr:
-                if device_slot:
-                    logger.info("Searching for %s device in speakers", device_slot)
+                # Alexa sends the slot even when nothing was said for it
+                if device_slot and device_slot.value:
+                    logger.debug("Searching for %s device in speakers", device_slot)
                     return self.choose_speaker(speakers, device_slot)
+                speaker = self.preferred_speaker(speakers)
+                if speaker:
+                    self.save_speaker(speaker)
             elif self.req_attr[self.device_id] not in (
                 speakers.keys() | not_speakers.keys()
             ):
                 logger.info(
                     "Saved speaker does not exist: %s", self.req_attr[self.device_id]
                 )
-                device = first(speaker_list, key=lambda s: s.is_active) or first(
-                    speaker_list, key=lambda s: not s.is_restricted
+                device = (
+                    self.preferred_speaker(speakers)
+                    or first(speaker_list, key=lambda s: s.is_active)
+                    or first(speaker_list, key=lambda s: not s.is_restricted)
                 )
                 self.save_speaker(device)
                 if device:
@@ -372,13 +902,13 @@ class NoiseblendRequestHandler(AbstractRequestHandler):
                         "Couldn't find a usable speaker, letting Noiseblend find one for us"
                     )
         elif len(not_speaker_list) == 1:
-            logger.info("Found 1 device (not speaker), using it as the playing device")
+            logger.debug("Found 1 device (not speaker), using it as the playing device")
             self.save_speaker(not_speaker_list[0])
         elif len(not_speaker_list) > 1 and device_slot:
-            logger.info("Found %s devices", len(not_speaker_list))
+            logger.debug("Found %s devices", len(not_speaker_list))
             if self.device_id not in self.req_attr:
                 if device_slot:
-                    logger.info("Searching for %s device in not speakers", device_slot)
+                    logger.debug("Searching for %s device in not speakers", device_slot)
                     return self.choose_speaker(not_speakers, device_slot)
             elif self.req_attr[self.device_id] not in (
                 speakers.keys() | not_speakers.keys()
@@ -387,8 +917,10 @@ class NoiseblendRequestHandler(AbstractRequestHandler):
                     "Saved device does not exist: %s", self.req_attr[self.device_id]
                 )
 
-                device = first(not_speaker_list, key=lambda s: s.is_active) or first(
-                    not_speaker_list, key=lambda s: not s.is_restricted
+                device = (
+                    self.preferred_speaker(not_speakers)
+                    or first(not_speaker_list, key=lambda s: s.is_active)
+                    or first(not_speaker_list, key=lambda s: not s.is_restricted)
                 )
                 self.save_speaker(device)
                 if device:
@@ -411,6 +943,7 @@ class NoiseblendRequestHandler(AbstractRequestHandler):
     def handle(self, handler_input, with_auth=True):
         try:
             self.handler_input = handler_input
+            self.progress = None
             self.response_builder = handler_input.response_builder
             self.req_envelope = handler_input.request_envelope
             self.device_id = self.req_envelope.context.system.device.device_id
@@ -421,11 +954,8 @@ class NoiseblendRequestHandler(AbstractRequestHandler):
                 scope.set_extra("context", self.req_envelope.context.to_dict())
                 scope.set_extra("request", self.req_envelope.request.to_dict())
 
-            if (
-                with_auth
-                and not self.req_envelope.session.user
-                or not self.req_envelope.session.user.access_token
-            ):
+            user = self.req_envelope.session.user
+            if with_auth and (not user or not user.access_token):
                 if isinstance(self.req_envelope.request, CanFulfillIntentRequest):
                     # self.can_fulfill_intent(maybe=True)
                     return None
@@ -435,7 +965,16 @@ class NoiseblendRequestHandler(AbstractRequestHandler):
                 )
                 return self.response_builder.response
 
-            self.token = self.req_envelope.session.user.access_token
+            self.token = user.access_token if user else None
+            if with_auth and token_expired(self.token):
+                logger.info("Access token expired, asking to relink the account")
+                if isinstance(self.req_envelope.request, CanFulfillIntentRequest):
+                    return None
+
+                self.response_builder.speak(NOTIFY_RELINK_ACCOUNT).set_card(
+                    LinkAccountCard()
+                )
+                return self.response_builder.response
 
             return None
         except Exception as exc:
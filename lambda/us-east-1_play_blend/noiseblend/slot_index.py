@@ -0,0 +1,124 @@
+"""Local fallback for slot values Alexa entity resolution couldn't match.
+
+The index is compiled from the interaction models at build time:
+
+    python -m noiseblend.slot_index ../../models/en-US.json ../../models/en-GB.json
+"""
+
+import argparse
+import json
+import re
+from functools import lru_cache
+from pathlib import Path
+
+from ask_sdk_model.slu.entityresolution import Value
+from fuzzywuzzy import fuzz
+
+from .constants import SLOT_FUZZY_THRESHOLD
+
+INDEX_PATH = Path(__file__).parent / "slot_index.json"
+INDEXED_TYPES = (
+    "BLEND",
+    "DEVICE_NAME",
+    "DIRECTION",
+    "MUSIC_THING",
+    "TUNEABLE_ATTRIBUTE",
+    "TUNING_DIRECTION",
+)
+FILLER_WORDS = {"a", "an", "the", "my", "some", "blend", "music", "playlist"}
+
+
+def normalize(text):
+    words = re.sub(r"[^a-z0-9 ]", " ", text.lower()).split()
+    return " ".join(word for word in words if word not in FILLER_WORDS)
+
+
+def compile_index(model_paths):
+    intents = {}
+    types = {}
+    for model_path in model_paths:
+        model = json.loads(Path(model_path).read_text())
+        language_model = model["interactionModel"]["languageModel"]
+
+        for intent in language_model["intents"]:
+            for slot in intent.get("slots", []):
+                if slot["type"] in INDEXED_TYPES:
+                    intents.setdefault(intent["name"], {})[slot["name"]] = slot["type"]
+
+        for slot_type in language_model.get("types", []):
+            if slot_type["name"] not in INDEXED_TYPES:
+                continue
+
+            values = types.setdefault(slot_type["name"], {})
+            for value in slot_type["values"]:
+                _, name, synonyms = values.setdefault(
+                    value["id"], [value["id"], value["name"]["value"], []]
+                )
+                for synonym in value["name"].get("synonyms", []):
+                    if synonym not in synonyms:
+                        synonyms.append(synonym)
+
+    return {
+        "intents": intents,
+        "types": {name: list(values.values()) for name, values in types.items()},
+    }
+
+
+class SlotIndex:
+    def __init__(self, index):
+        self.intents = index["intents"]
+        self.exact = {}
+        self.normalized = {}
+        for slot_type, values in index["types"].items():
+            exact = self.exact.setdefault(slot_type, {})
+            normalized = self.normalized.setdefault(slot_type, {})
+            for value_id, name, synonyms in values:
+                value = Value(name=name, id=value_id)
+                for text in [name] + synonyms:
+                    exact.setdefault(text.lower(), value)
+                    normalized.setdefault(normalize(text), value)
+
+    def slot_type(self, intent_name, slot_name):
+        return self.intents.get(intent_name, {}).get(slot_name)
+
+    def match(self, slot_type, text):
+        if slot_type not in self.exact or not text:
+            return None
+
+        value = self.exact[slot_type].get(text.lower())
+        if value:
+            return value
+
+        text = normalize(text)
+        value = self.normalized[slot_type].get(text)
+        if value or not text:
+            return value
+
+        score, candidate = max(
+            ((fuzz.ratio(text, known), known) for known in self.normalized[slot_type]),
+            default=(0, None),
+        )
+        if score < SLOT_FUZZY_THRESHOLD:
+            return None
+        return self.normalized[slot_type][candidate]
+
+
+@lru_cache(maxsize=1)
+def slot_index():
+    if not INDEX_PATH.exists():
+        return SlotIndex({"intents": {}, "types": {}})
+    return SlotIndex(json.loads(INDEX_PATH.read_text()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("models", nargs="+", help="interaction model JSON files")
+    parser.add_argument("-o", "--output", default=str(INDEX_PATH))
+    args = parser.parse_args()
+
+    index = compile_index(args.models)
+    Path(args.output).write_text(json.dumps(index, separators=(",", ":")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import hashlib
+import time
+
+from .constants import (
+    SPEAKER_CONFIDENCE,
+    SPEAKER_HALF_LIFE,
+    SPEAKER_MAX_ECHOS,
+    SPEAKER_MAX_PER_ECHO,
+    SPEAKER_MIN_USES,
+)
+
+
+def echo_key(device_id):
+    """Short stable key for an Echo, whose device IDs are hundreds of characters."""
+    return hashlib.sha1(device_id.encode()).hexdigest()[:12]
+
+
+class SpeakerPreferences:
+    """How often each speaker was picked from an Echo, decaying over time.
+
+    Kept in persistent attributes as `speakers: {echo: {"t": updated, "c":
+    {speaker: "count"}}}`, where counts halve every `half_life` seconds.
+    """
+
+    def __init__(
+        self,
+        attr,
+        device_id,
+        half_life=SPEAKER_HALF_LIFE,
+        max_echos=SPEAKER_MAX_ECHOS,
+        max_speakers=SPEAKER_MAX_PER_ECHO,
+    ):
+        self.attr = attr
+        self.echo = echo_key(device_id or "")
+        self.half_life = half_life
+        self.max_echos = max_echos
+        self.max_speakers = max_speakers
+
+    @property
+    def echos(self):
+        return self.attr.get("speakers") or {}
+
+    def counts(self, now=None):
+        entry = self.echos.get(self.echo)
+        if not entry:
+            return {}
+
+        decay = 0.5 ** (((now or time.time()) - float(entry["t"])) / self.half_life)
+        return {name: float(count) * decay for name, count in entry["c"].items()}
+
+    def record(self, name):
+        now = time.time()
+        counts = self.counts(now)
+        counts[name] = counts.get(name, 0) + 1
+
+        top = sorted(counts, key=counts.get, reverse=True)[: self.max_speakers]
+        if not self.attr.get("speakers"):
+            self.attr["speakers"] = {}
+        echos = self.attr["speakers"]
+        echos[self.echo] = {
+            "t": int(now),
+            "c": {speaker: f"{counts[speaker]:.3f}" for speaker in top},
+        }
+
+        by_age = sorted(echos, key=lambda echo: echos[echo]["t"])
+        for echo in by_age[: max(len(by_age) - self.max_echos, 0)]:
+            del echos[echo]
+
+    def likely(self, names, confidence=SPEAKER_CONFIDENCE, min_uses=SPEAKER_MIN_USES):
+        """The most used of `names` if it's picked often enough, else None."""
+        counts = self.counts()
+        counts = {name: counts[name] for name in names if name in counts}
+        if not counts:
+            return None
+
+        name = max(counts, key=counts.get)
+        if counts[name] < min_uses or counts[name] / sum(counts.values()) < confidence:
+            return None
+        return name
@@ -0,0 +1,36 @@
+"""Expiry of account-link access tokens, read without calling the backend.
+
+Tokens that are JWTs carry an `exp` claim. The signature is not checked:
+the claim is only used to skip backend calls that would fail anyway.
+Opaque tokens are never considered expired.
+"""
+
+import base64
+import json
+import time
+from functools import lru_cache
+
+from .constants import TOKEN_CACHE_SIZE, TOKEN_EXPIRY_LEEWAY
+
+
+@lru_cache(maxsize=TOKEN_CACHE_SIZE)
+def token_expiry(token):
+    parts = token.split(".")
+    if len(parts) != 3:
+        return None
+
+    payload = parts[1] + "=" * (-len(parts[1]) % 4)
+    try:
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+    except (ValueError, TypeError):
+        return None
+
+    expiry = claims.get("exp") if isinstance(claims, dict) else None
+    if isinstance(expiry, bool) or not isinstance(expiry, (int, float)):
+        return None
+    return expiry
+
+
+def token_expired(token, leeway=TOKEN_EXPIRY_LEEWAY):
+    expiry = token_expiry(token) if token else None
+    return expiry is not None and expiry + leeway < time.time()
@@ -0,0 +1,133 @@
+import json
+
+from .constants import TUNEABLE_DEFAULTS, TUNING_MAX_BYTES, TUNING_MAX_PROFILES
+from .helpers import cap
+
+OPPOSITE_DIRECTIONS = {
+    "increase": "decrease",
+    "decrease": "increase",
+    "max": "min",
+    "min": "max",
+    "reset": "reset",
+}
+
+
+def resolve_change(tuneable, direction):
+    """Turn a change of a `reverse_` tuneable into the opposite change of the real one."""
+    if tuneable.startswith("reverse_"):
+        return tuneable[8:], OPPOSITE_DIRECTIONS[direction]
+    return tuneable, direction
+
+
+def adjust(attributes, tuneable, direction):
+    """Move `tuneable` one step, to a bound or back to its default, in place.
+
+    `attributes` is a tuning profile of `{tuneable: "0.50"}`. Values stay
+    within the bounds in TUNEABLE_DEFAULTS.
+    """
+    defaults = TUNEABLE_DEFAULTS[tuneable]
+    if direction == "reset":
+        attributes.pop(tuneable, None)
+        return
+
+    if direction == "max":
+        value = defaults.max
+    elif direction == "min":
+        value = defaults.min
+    else:
+        value = float(attributes.get(tuneable, defaults.default))
+        value += defaults.step if direction == "increase" else -defaults.step
+    attributes[tuneable] = f"{cap(value, defaults.min, defaults.max):.2f}"
+
+
+def apply_changes(attributes, changes):
+    """Apply `(tuneable, direction)` changes in order, returning the tuneables touched."""
+    changed = []
+    for tuneable, direction in changes:
+        tuneable, direction = resolve_change(tuneable, direction)
+        adjust(attributes, tuneable, direction)
+        if tuneable not in changed:
+            changed.append(tuneable)
+    return changed
+
+
+class TuningStore:
+    """Tuning profiles per blend, radio and random kept in persistent attributes.
+
+    Profiles live under `attributes` as `{thing: {tuneable: "0.50"}}` and
+    `attributes_lru` keeps the things from least to most recently used.
+    The store is capped by profile count and by serialized size, evicting
+    the least recently used profiles first.
+
+    Reads leave the attributes untouched and only writes move a profile up.
+    Every handler that plays a profile also writes it, tuning with the new
+    values and playing by resetting it, so this is still the order of use.
+    """
+
+    def __init__(
+        self, attr, max_profiles=TUNING_MAX_PROFILES, max_bytes=TUNING_MAX_BYTES
+    ):
+        self.attr = attr
+        self.max_profiles = max_profiles
+        self.max_bytes = max_bytes
+
+    @property
+    def profiles(self):
+        return self.attr.get("attributes") or {}
+
+    @property
+    def order(self):
+        profiles = self.profiles
+        order = [
+            thing
+            for thing in self.attr.get("attributes_lru") or []
+            if thing in profiles
+        ]
+        legacy = [thing for thing in profiles if thing not in order]
+        return legacy + order
+
+    @staticmethod
+    def serialize(attributes):
+        return {
+            tuneable: value if isinstance(value, str) else f"{value:.2f}"
+            for tuneable, value in attributes.items()
+        }
+
+    def touch(self, thing):
+        self.attr["attributes_lru"] = [t for t in self.order if t != thing] + [thing]
+
+    def size(self):
+        return len(json.dumps(self.profiles, separators=(",", ":")))
+
+    def evict(self, keep):
+        order = self.order
+        while len(order) > 1 and (
+            len(order) > self.max_profiles or self.size() > self.max_bytes
+        ):
+            thing = order[0] if order[0] != keep else order[1]
+            order.remove(thing)
+            del self.profiles[thing]
+        self.attr["attributes_lru"] = order
+
+    def get(self, thing):
+        attributes = self.profiles.get(thing)
+        if not attributes:
+            return None
+        return {tuneable: float(value) for tuneable, value in attributes.items()}
+
+    def set(self, thing, attributes):
+        if not attributes:
+            self.delete(thing)
+            return
+
+        if not self.attr.get("attributes"):
+            self.attr["attributes"] = {}
+        self.attr["attributes"][thing] = self.serialize(attributes)
+        self.touch(thing)
+        self.evict(keep=thing)
+
+    def delete(self, thing):
+        if thing not in self.profiles:
+            return
+        del self.profiles[thing]
+        self.attr["attributes_lru"] = [t for t in self.order if t != thing]
@@ -0,0 +1,128 @@
+"""Scheduled keep-warm pings.
+
+A ping is either a CloudWatch scheduled event or `{"warmup": true}`. It
+primes the HTTP connection pool, DNS, the persistence backend and the lazily
+imported request models, without reading or writing any user's attributes.
+Connecting to every API endpoint also measures their latency.
+"""
+
+import json
+import logging
+import socket
+import time
+from urllib.parse import urlparse
+
+from ask_sdk_core.serialize import DefaultSerializer
+from ask_sdk_model import RequestEnvelope, ResponseEnvelope
+
+from .client import session
+from .constants import WARMUP_KEY, WARMUP_TIMEOUT
+from .endpoints import pool
+from .reporting import capture
+from .slot_index import slot_index
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_ENVELOPE = {
+    "version": "1.0",
+    "session": {
+        "new": True,
+        "sessionId": "warmup",
+        "application": {"applicationId": "warmup"},
+        "user": {"userId": "warmup"},
+    },
+    "context": {
+        "System": {
+            "application": {"applicationId": "warmup"},
+            "user": {"userId": "warmup"},
+            "device": {"deviceId": "warmup", "supportedInterfaces": {}},
+        }
+    },
+    "request": {
+        "type": "IntentRequest",
+        "requestId": "warmup",
+        "timestamp": "2019-01-01T00:00:00Z",
+        "locale": "en-US",
+        "intent": {
+            "name": "PlayBlendIntent",
+            "confirmationStatus": "NONE",
+            "slots": {
+                "blend": {
+                    "name": "blend",
+                    "value": "warmup",
+                    "resolutions": {
+                        "resolutionsPerAuthority": [
+                            {
+                                "authority": "warmup",
+                                "status": {"code": "ER_SUCCESS_NO_MATCH"},
+                            }
+                        ]
+                    },
+                }
+            },
+        },
+    },
+}
+
+
+def is_warmup(event):
+    if not isinstance(event, dict) or "request" in event:
+        return False
+    return event.get("warmup") is True or (
+        event.get("source") == "aws.events"
+        and event.get("detail-type") == "Scheduled Event"
+    )
+
+
+def resolve_dns():
+    for endpoint in pool.endpoints:
+        url = urlparse(endpoint.url)
+        try:
+            socket.getaddrinfo(url.hostname, url.port or 443, proto=socket.IPPROTO_TCP)
+        except OSError as exc:
+            logger.warning("Resolving %s failed: %r", url.hostname, exc)
+
+
+def open_connections():
+    """Connect to every endpoint, marking the unreachable ones as failed."""
+    for endpoint in pool.endpoints:
+        started = time.time()
+        try:
+            session.head(endpoint.url, timeout=WARMUP_TIMEOUT)
+        except Exception as exc:
+            logger.warning("Warming up %s failed: %r", endpoint.url, exc)
+            pool.fail(endpoint)
+            continue
+        pool.record(endpoint, time.time() - started)
+
+
+def import_models():
+    serializer = DefaultSerializer()
+    envelope = serializer.deserialize(json.dumps(SAMPLE_ENVELOPE), RequestEnvelope)
+    serializer.serialize(ResponseEnvelope(version="1.0"))
+    slot_index()
+    return envelope
+
+
+def warm_up(persistence_adapter=None):
+    """Run every primer, log their timings and return them."""
+    primers = [
+        ("dns", resolve_dns),
+        ("http", open_connections),
+        ("imports", import_models),
+    ]
+    if persistence_adapter is not None:
+        primers.append(("persistence", lambda: persistence_adapter.read(WARMUP_KEY)))
+
+    timings = {}
+    for name, primer in primers:
+        started = time.time()
+        try:
+            primer()
+        except Exception as exc:
+            logger.exception(exc)
+            capture(exc)
+        timings[name] = round((time.time() - started) * 1000, 1)
+
+    logger.info("Warmed up: %s", timings)
+    return {"warm": True, "timings": timings}
@@ -0,0 +1,36 @@
+from decimal import Decimal
+
+import pytest
+from boto3.dynamodb.types import Binary
+
+from noiseblend.codec import decode, encode
+
+
+def test_round_trip_keeps_the_attribute_tree():
+    attributes = {
+        "last_blend": {"id": "deepFocus", "name": "deep focus"},
+        "attributes": {"deepFocus": {"energy": "0.70"}},
+        "attributes_lru": ["deepFocus"],
+        "rate_limit": {"tokens": "1.000", "updated": 1571443200000},
+    }
+    assert decode(encode(attributes)) == attributes
+
+
+def test_decimals_from_dynamodb_round_trip():
+    attributes = {"version": Decimal("3"), "volume": Decimal("0.5")}
+    decoded = decode(encode(attributes))
+    assert decoded == {"version": 3, "volume": Decimal("0.5")}
+    assert isinstance(decoded["volume"], Decimal)
+    assert isinstance(decoded["version"], int)
+
+
+def test_decode_accepts_binary_wrappers():
+    blob = encode({"a": 1})
+    assert decode(bytearray(blob)) == {"a": 1}
+    assert decode(memoryview(blob)) == {"a": 1}
+    assert decode(Binary(blob)) == {"a": 1}
+
+
+def test_encode_rejects_unknown_types():
+    with pytest.raises(TypeError):
+        encode({"a": object()})
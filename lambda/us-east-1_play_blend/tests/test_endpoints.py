@@ -0,0 +1,80 @@
+import pytest
+
+from noiseblend import endpoints
+from noiseblend.endpoints import EndpointPool, region_endpoints
+
+URLS = ["https://a.test", "https://b.test", "https://c.test"]
+
+
+def urls(candidates):
+    return [endpoint.url for endpoint in candidates]
+
+
+@pytest.fixture
+def pool():
+    return EndpointPool(URLS, weight=0.5, cooldown=30, max_failures=2, explore=0)
+
+
+def test_unmeasured_endpoints_keep_configuration_order(pool):
+    assert urls(pool.candidates()) == URLS
+
+
+def test_fastest_measured_endpoint_comes_first(pool):
+    a, b, c = pool.endpoints
+    pool.record(a, 0.3)
+    pool.record(c, 0.1)
+    assert urls(pool.candidates()) == [
+        "https://c.test",
+        "https://a.test",
+        "https://b.test",
+    ]
+
+
+def test_latency_is_an_exponentially_weighted_average(pool):
+    a, b, _ = pool.endpoints
+    pool.record(a, 0.1)
+    pool.record(b, 0.2)
+    pool.record(a, 0.5)
+    assert a.rtt == pytest.approx(0.3)
+    assert urls(pool.candidates())[:2] == ["https://b.test", "https://a.test"]
+
+
+def test_failing_endpoint_cools_down_then_recovers(pool, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(endpoints.time, "time", lambda: now[0])
+    a = pool.endpoints[0]
+    pool.record(a, 0.01)
+
+    pool.fail(a)
+    assert urls(pool.candidates())[0] == "https://a.test"
+    pool.fail(a)
+    assert urls(pool.candidates())[-1] == "https://a.test"
+
+    now[0] += 31
+    assert urls(pool.candidates())[0] == "https://a.test"
+    pool.record(a, 0.01)
+    assert a.failures == 0
+
+
+def test_explores_an_unmeasured_endpoint(monkeypatch):
+    pool = EndpointPool(URLS, explore=1)
+    pool.record(pool.endpoints[0], 0.1)
+    monkeypatch.setattr(endpoints.random, "random", lambda: 0.5)
+    assert urls(pool.candidates(explore=True))[0] == "https://b.test"
+    assert urls(pool.candidates())[0] == "https://a.test"
+
+
+@pytest.mark.parametrize(
+    "config, expected",
+    [
+        ('{"eu-west-1": ["https://eu.test"]}', ["https://eu.test"]),
+        ('{"default": "https://default.test"}', ["https://default.test"]),
+        ('{"us-east-1": ["https://us.test"]}', [endpoints.API_URL]),
+        ('["https://a.test"]', [endpoints.API_URL]),
+        ("not json", [endpoints.API_URL]),
+        ('{"eu-west-1": [1]}', [endpoints.API_URL]),
+        ("", [endpoints.API_URL]),
+    ],
+)
+def test_region_endpoints(config, expected):
+    assert region_endpoints(config, "eu-west-1") == expected
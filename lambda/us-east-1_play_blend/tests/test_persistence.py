@@ -0,0 +1,137 @@
+import time
+
+import pytest
+from ask_sdk_core.exceptions import PersistenceException
+
+from noiseblend.exceptions import VersionConflictError
+from noiseblend.persistence import (
+    InMemoryAdapter,
+    SQLiteAdapter,
+    merge_attributes,
+    sqlite_connection,
+)
+
+KEY = "user"
+
+
+def keygen(request_envelope):
+    return request_envelope
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def adapters(request, tmp_path):
+    """Two adapters sharing one backend, like two containers."""
+    if request.param == "memory":
+        store = {}
+        return [InMemoryAdapter(store=store, partition_keygen=keygen) for _ in range(2)]
+
+    connection = sqlite_connection(str(tmp_path / "attributes.db"))
+    return [SQLiteAdapter(connection, partition_keygen=keygen) for _ in range(2)]
+
+
+def test_merge_keeps_remote_fields_local_did_not_touch():
+    base = {"a": 1, "b": 1}
+    local = {"a": 2, "b": 1}
+    remote = {"a": 1, "b": 3, "c": 4}
+    assert merge_attributes(base, local, remote) == {"a": 2, "b": 3, "c": 4}
+
+
+def test_merge_local_change_wins_over_remote_change():
+    assert merge_attributes({"a": 1}, {"a": 2}, {"a": 3}) == {"a": 2}
+
+
+def test_merge_local_removal_wins():
+    assert merge_attributes({"a": 1, "b": 1}, {"b": 1}, {"a": 3, "b": 1}) == {"b": 1}
+
+
+def test_merge_nested_maps_field_by_field():
+    base = {"attributes": {"x": {"energy": "0.50"}}}
+    local = {"attributes": {"x": {"energy": "0.70"}}}
+    remote = {"attributes": {"x": {"energy": "0.50"}, "y": {"tempo": "90.00"}}}
+    assert merge_attributes(base, local, remote) == {
+        "attributes": {"x": {"energy": "0.70"}, "y": {"tempo": "90.00"}}
+    }
+
+
+def test_merge_without_base_lets_every_local_field_win():
+    assert merge_attributes(None, {"a": 2}, {"a": 3, "b": 4}) == {"a": 2, "b": 4}
+
+
+def test_merge_leaves_inputs_untouched():
+    remote = {"a": {"b": 1}}
+    merge_attributes({}, {"a": {"c": 2}}, remote)
+    assert remote == {"a": {"b": 1}}
+
+
+def test_concurrent_writes_are_merged(adapters):
+    first, second = adapters
+    first.save_attributes(KEY, {"last_blend": "a", "volume": 5})
+
+    mine = first.get_attributes(KEY)
+    theirs = second.get_attributes(KEY)
+    theirs["volume"] = 7
+    theirs["speakers"] = {"echo": "kitchen"}
+    second.save_attributes(KEY, theirs)
+
+    mine["last_blend"] = "b"
+    first.save_attributes(KEY, mine)
+
+    assert first.read(KEY)[0] == {
+        "last_blend": "b",
+        "volume": 7,
+        "speakers": {"echo": "kitchen"},
+    }
+    assert first.read(KEY)[1] == 3
+
+
+def test_conflicting_writes_to_one_field_keep_the_later(adapters):
+    first, second = adapters
+    first.save_attributes(KEY, {"last_blend": "a"})
+
+    mine = first.get_attributes(KEY)
+    theirs = second.get_attributes(KEY)
+    theirs["last_blend"] = "c"
+    second.save_attributes(KEY, theirs)
+
+    mine["last_blend"] = "b"
+    first.save_attributes(KEY, mine)
+
+    assert first.read(KEY)[0] == {"last_blend": "b"}
+
+
+def test_projected_save_updates_only_changed_attributes(adapters):
+    first, second = adapters
+    first.save_attributes(KEY, {"last_blend": "a", "playlists": {"p": 1}})
+
+    first.project(KEY, ["last_blend"])
+    mine = first.get_attributes(KEY)
+    assert mine == {"last_blend": "a"}
+
+    theirs = second.get_attributes(KEY)
+    theirs["playlists"] = {}
+    second.save_attributes(KEY, theirs)
+
+    mine["last_blend"] = "b"
+    first.save_attributes(KEY, mine)
+
+    assert first.read(KEY)[0] == {"last_blend": "b", "playlists": {}}
+
+
+def test_gives_up_after_repeated_conflicts():
+    class Contended(InMemoryAdapter):
+        def write(self, key, attributes, version):
+            raise VersionConflictError(key)
+
+    adapter = Contended(partition_keygen=keygen)
+    with pytest.raises(PersistenceException):
+        adapter.save_attributes(KEY, {"a": 1})
+
+
+def test_expired_batch_items_are_hidden_and_purged(tmp_path):
+    adapter = SQLiteAdapter(sqlite_connection(str(tmp_path / "attributes.db")))
+    adapter.batch_save_attributes({"old": {"a": 1}}, expires=int(time.time()) - 1)
+    adapter.batch_save_attributes({"new": {"b": 2}}, expires=int(time.time()) + 60)
+
+    assert adapter.batch_get_attributes(["old", "new"]) == {"new": {"b": 2}}
+    rows = adapter.connection.execute("SELECT id FROM attributes").fetchall()
+    assert rows == [("new",)]
@@ -0,0 +1,83 @@
+from collections import OrderedDict
+
+from noiseblend import ratelimit
+from noiseblend.ratelimit import TokenBucket
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+def bucket(attr, local=None, burst=2, per_minute=6):
+    return TokenBucket(
+        attr,
+        "user",
+        burst=burst,
+        per_minute=per_minute,
+        local=OrderedDict() if local is None else local,
+    )
+
+
+def test_empties_after_a_burst(monkeypatch):
+    monkeypatch.setattr(ratelimit, "time", Clock())
+    attr = {}
+    limiter = bucket(attr)
+    assert limiter.take()
+    assert limiter.take()
+    assert not limiter.take()
+    assert attr["rate_limit"]["tokens"] == "0.000"
+
+
+def test_refills_at_the_configured_rate(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit, "time", clock)
+    attr = {}
+    limiter = bucket(attr)
+    limiter.take()
+    limiter.take()
+
+    clock.now += 5
+    assert not limiter.take()
+    clock.now += 5
+    assert limiter.take()
+    assert not limiter.take()
+
+
+def test_refill_is_capped_at_the_burst(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit, "time", clock)
+    limiter = bucket({})
+    limiter.take()
+
+    clock.now += 3600
+    assert limiter.take()
+    assert limiter.take()
+    assert not limiter.take()
+
+
+def test_stored_bucket_holds_across_containers(monkeypatch):
+    monkeypatch.setattr(ratelimit, "time", Clock())
+    attr = {}
+    bucket(attr).take()
+    bucket(attr).take()
+    assert not bucket(attr).take()
+
+
+def test_empty_local_bucket_refuses_without_the_stored_one(monkeypatch):
+    monkeypatch.setattr(ratelimit, "time", Clock())
+    local = OrderedDict()
+    attr = {}
+    bucket(attr, local).take()
+    bucket(attr, local).take()
+    # A stale copy of the attributes still shows a full bucket
+    assert not bucket({}, local).take()
+
+
+def test_disabled_without_a_burst():
+    attr = {}
+    assert bucket(attr, burst=0).take()
+    assert attr == {}
@@ -0,0 +1,57 @@
+import logging
+
+import sentry_sdk
+from sentry_sdk.transport import Transport
+
+from noiseblend import reporting
+
+
+class RecordingTransport(Transport):
+    def __init__(self, options=None):
+        super().__init__(options)
+        self.envelopes = []
+        self.flushes = []
+
+    def capture_envelope(self, envelope):
+        self.envelopes.append(envelope)
+
+    def flush(self, timeout, callback=None):
+        self.flushes.append(timeout)
+
+
+class Context:
+    def get_remaining_time_in_millis(self):
+        return 3000
+
+
+def test_logged_and_captured_error_is_flushed(tmp_path, monkeypatch):
+    dsn_file = tmp_path / "sentry_dsn"
+    dsn_file.write_text("https://key@sentry.invalid/1")
+    transport = RecordingTransport()
+    monkeypatch.setattr(reporting, "pending", 0)
+    reporting.init_sentry(dsn_file, transport=transport)
+
+    try:
+        try:
+            raise RuntimeError("boom")
+        except RuntimeError as exc:
+            logging.getLogger("noiseblend.test").exception(exc)
+            reporting.capture(exc)
+
+        reporting.flush(Context())
+    finally:
+        sentry_sdk.init()
+
+    assert len(transport.envelopes) == 1
+    assert transport.flushes
+    assert reporting.pending == 0
+
+
+def test_nothing_queued_skips_flush(monkeypatch):
+    flushes = []
+    monkeypatch.setattr(reporting, "pending", 0)
+    monkeypatch.setattr(sentry_sdk, "flush", lambda **kw: flushes.append(kw))
+
+    reporting.flush(Context())
+
+    assert not flushes
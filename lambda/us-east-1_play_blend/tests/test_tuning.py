@@ -0,0 +1,89 @@
+import pytest
+
+from blend import TuneableAttributeHandler
+from noiseblend.tuning import TuningStore, adjust, apply_changes
+
+normalize = TuneableAttributeHandler.normalize_tuneable_value
+
+
+def test_adjust_steps_from_the_default():
+    attributes = {}
+    adjust(attributes, "energy", "increase")
+    assert attributes == {"energy": "0.70"}
+
+    adjust(attributes, "energy", "decrease")
+    adjust(attributes, "energy", "decrease")
+    assert attributes == {"energy": "0.30"}
+
+
+def test_adjust_stays_within_bounds():
+    attributes = {"loudness": "-5.00", "tempo": "10.00"}
+    adjust(attributes, "loudness", "increase")
+    adjust(attributes, "tempo", "decrease")
+    assert attributes == {"loudness": "0.00", "tempo": "0.00"}
+
+
+def test_adjust_to_bounds_and_reset():
+    attributes = {"loudness": "-30.00"}
+    adjust(attributes, "loudness", "min")
+    assert attributes == {"loudness": "-60.00"}
+    adjust(attributes, "loudness", "max")
+    assert attributes == {"loudness": "0.00"}
+    adjust(attributes, "loudness", "reset")
+    assert attributes == {}
+
+
+def test_apply_changes_in_order():
+    attributes = {"energy": "0.50"}
+    changed = apply_changes(
+        attributes,
+        [("energy", "increase"), ("tempo", "max"), ("energy", "increase")],
+    )
+    assert changed == ["energy", "tempo"]
+    assert attributes == {"energy": "0.90", "tempo": "320.00"}
+
+
+def test_apply_changes_reverses_reverse_tuneables():
+    attributes = {}
+    changed = apply_changes(
+        attributes, [("reverse_acousticness", "increase"), ("reverse_tempo", "max")]
+    )
+    assert changed == ["acousticness", "tempo"]
+    assert attributes == {"acousticness": "0.30", "tempo": "0.00"}
+
+
+@pytest.mark.parametrize(
+    "tuneable, value, normalized",
+    [
+        ("loudness", -60.0, 0),
+        ("loudness", -30.0, 5),
+        ("loudness", 0.0, 10),
+        ("loudness", -66.0, 0),
+        ("loudness", 6.0, 10),
+        ("energy", 0.0, 0),
+        ("energy", 0.7, 7),
+        ("tempo", 320, 10),
+        ("popularity", 50, 5),
+    ],
+)
+def test_normalize_scales_min_to_max(tuneable, value, normalized):
+    assert normalize(tuneable, value) == normalized
+
+
+def test_store_reads_leave_attributes_untouched():
+    attr = {}
+    store = TuningStore(attr)
+    assert store.get("deepFocus") is None
+    assert store.order == []
+    assert attr == {}
+
+
+def test_store_evicts_least_recently_used():
+    attr = {}
+    store = TuningStore(attr, max_profiles=2)
+    store.set("a", {"energy": 0.5})
+    store.set("b", {"energy": 0.6})
+    store.set("a", {"energy": 0.7})
+    store.set("c", {"energy": 0.8})
+    assert sorted(attr["attributes"]) == ["a", "c"]
+    assert store.get("a") == {"energy": 0.7}
@@ -0,0 +1,51 @@
+import time
+
+from ask_sdk_model import Response
+from ask_sdk_model.ui import PlainTextOutputSpeech, Reprompt
+
+from noiseblend.request_handler import NoiseblendHandlerAdapter
+
+should_write_behind = NoiseblendHandlerAdapter.should_write_behind
+
+ATTRIBUTES = {"attributes": {"deepFocus": {"energy": "0.70"}}}
+
+
+def response(should_end_session, reprompt=True):
+    return Response(
+        output_speech=PlainTextOutputSpeech(text="Energy is at 7"),
+        reprompt=(
+            Reprompt(PlainTextOutputSpeech(text="Anything else?")) if reprompt else None
+        ),
+        should_end_session=should_end_session,
+    )
+
+
+def pending(turns=1, age=0):
+    return {"attributes": ATTRIBUTES, "since": time.time() - age, "turns": turns}
+
+
+def test_defers_while_the_session_waits_for_a_reply():
+    assert should_write_behind(response(False), None, ATTRIBUTES)
+    assert should_write_behind(response(False), pending(), ATTRIBUTES)
+
+
+def test_flushes_when_the_response_ends_the_session():
+    assert not should_write_behind(response(True), pending(), ATTRIBUTES)
+    assert not should_write_behind(
+        response(None, reprompt=False), pending(), ATTRIBUTES
+    )
+    assert not should_write_behind(None, pending(), ATTRIBUTES)
+
+
+def test_flushes_when_the_session_stays_open_without_a_reprompt():
+    assert not should_write_behind(response(False, reprompt=False), None, ATTRIBUTES)
+
+
+def test_flushes_after_the_turn_and_time_bounds():
+    assert not should_write_behind(response(False), pending(turns=3), ATTRIBUTES)
+    assert not should_write_behind(response(False), pending(age=3600), ATTRIBUTES)
+
+
+def test_flushes_attributes_too_big_for_the_session():
+    big = {"attributes": {"blend": {"energy": "x" * 10000}}}
+    assert not should_write_behind(response(False), None, big)